@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# Scalability benchmark: generates family-trees of growing size (see generateGedcom.py) and measures wall time and
+# peak memory of parsing (parseFile, parseFileToDFs), of every join shared by the user stories and of every user story.
+#
+# Peak memory is measured with tracemalloc, which also traces numpy/pandas buffers but slows down pure python code.
+# Run with --no-memory for wall times without that overhead.
+#
+# A user story (or join) that took longer than --budget seconds is not run again on the larger trees, so quadratic
+# stories do not block the run.
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gedcomValidator'))
+
+from generateGedcom import generate_tree, write_gedcom
+import gedcomParser.fileToDicts
+import gedcomParser.fileToDataframes
+import validate  # registers the rules of all user stories
+import registry
+from context import ValidationContext
+from utils import tabulate_df
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+TABLES = ['join_by_spouse', 'join_by_child', 'join_both_spouses_to_family', 'family_graph']
+
+
+def measure(function: Callable[[], Any], memory: bool = True) -> Tuple[Any, float, float]:
+    """
+    :return: the result of function(), the wall time in seconds and the peak memory in MB (NaN if not measured)
+    """
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    peak = float('nan')
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def stories() -> Dict[str, list]:
+    """:return: the rules of every user story, by story id"""
+    by_story: Dict[str, list] = {}
+    for r in registry.rules:
+        by_story.setdefault(r.story_id, []).append(r)
+    return by_story
+
+
+def run_benchmark(sizes: List[int], seed: int = 0, memory: bool = True, budget: float = 60.0,
+                  directory: str = None) -> List[Dict[str, Any]]:
+    """
+    Run all stages on a generated tree of every size.
+    :return: one result per stage and size: size, stage, seconds, peak_mb (skipped stages have seconds None)
+    """
+    directory = directory or tempfile.mkdtemp(prefix="gedcom_benchmark_")
+    results: List[Dict[str, Any]] = []
+    over_budget = set()
+
+    def stage(size: int, name: str, function: Callable[[], Any]) -> Any:
+        if name in over_budget:
+            results.append({'size': size, 'stage': name, 'seconds': None, 'peak_mb': None})
+            return None
+        result, seconds, peak = measure(function, memory)
+        results.append({'size': size, 'stage': name, 'seconds': seconds, 'peak_mb': peak})
+        if seconds > budget:
+            over_budget.add(name)
+        print("{:>8} {:<40} {:>10.3f} s {:>10.1f} MB".format(size, name, seconds, peak), file=sys.stderr)
+        return result
+
+    for size in sizes:
+        filename = os.path.join(directory, "generated_{}_{}.ged".format(size, seed))
+        if not os.path.exists(filename):
+            write_gedcom(generate_tree(size, seed), filename)
+        stage(size, 'parseFile', lambda: gedcomParser.fileToDicts.parseFile(filename))
+        indivs_df, families_df = stage(size, 'parseFileToDFs',
+                                       lambda: gedcomParser.fileToDataframes.parseFileToDFs(filename))
+        ctx = ValidationContext(indivs_df, families_df)
+        for table in TABLES:
+            stage(size, table, lambda: ctx.derived(table))
+        stage(size, 'US28', lambda: validate.order_siblings_by_age(ctx))
+        for story_id, story_rules in stories().items():
+            stage(size, story_id, lambda: [r.anomalies(ctx) for r in story_rules])
+    return results
+
+
+def summary(results: List[Dict[str, Any]]) -> str:
+    """:return: table with one row per stage and the seconds / MB for every size as columns"""
+    df = pd.DataFrame(results)
+    seconds = df.pivot(index='stage', columns='size', values='seconds').add_suffix(' s')
+    peak = df.pivot(index='stage', columns='size', values='peak_mb').add_suffix(' MB')
+    table = seconds.join(peak).reindex(list(dict.fromkeys(df['stage'])))
+    return tabulate_df(table)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark the validator on generated family-trees")
+    arg_parser.add_argument("--sizes", type=lambda s: [int(n) for n in s.split(",")], default=DEFAULT_SIZES,
+                            help="comma separated numbers of individuals (default: 1000,10000,100000,1000000)")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--no-memory", action="store_false", dest="memory", help="do not measure peak memory")
+    arg_parser.add_argument("--budget", type=float, default=60.0,
+                            help="seconds after which a stage is not run on larger trees (default: 60)")
+    arg_parser.add_argument("--dir", help="directory for the generated files (default: a new temporary directory)")
+    arg_parser.add_argument("--json", help="also write the results to this file")
+    args = arg_parser.parse_args()
+    results = run_benchmark(args.sizes, args.seed, args.memory, args.budget, args.dir)
+    print(summary(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# Generates synthetic GEDCOM family-trees of any size for benchmarks and correctness checks.
+#
+# The tree consists of GENERATIONS generations of about the same size. The first generation are founders with random
+# surnames, every later generation are the children of the couples of the previous one (sons and daughters take the
+# surname of their father). Dates are chosen so that a generated tree violates none of the ERROR user stories:
+# parents marry in their twenties, siblings are born at least 14 months apart, everybody born before the last
+# generations died in old age, nobody is born after LAST_YEAR.
+#
+# Anomalies violating a chosen user story can be injected (see injections), the ground truth of what the validator
+# should report is written to a JSON manifest next to the file.
+#
+# The same size, anomalies and seed always produce the same file.
+
+import argparse
+import json
+import os
+import random
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Union
+
+GENERATIONS = 6
+FIRST_YEAR = 1800
+LAST_YEAR = 2010
+MAX_CHILDREN = 4
+MONTHS = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+
+
+class Individual:
+    __slots__ = ['id', 'given', 'surname', 'sex', 'birth', 'death', 'famc', 'fams']
+
+    def __init__(self, id: str, given: str, surname: str, sex: str, birth: date, death: Optional[date]):
+        self.id = id
+        self.given = given
+        self.surname = surname
+        self.sex = sex
+        self.birth = birth
+        self.death = death
+        self.famc: Optional[str] = None
+        self.fams: List[str] = []
+
+    @property
+    def name(self) -> str:
+        return "{} /{}/".format(self.given, self.surname)
+
+
+class Family:
+    __slots__ = ['id', 'husband', 'wife', 'children', 'married', 'divorced']
+
+    def __init__(self, id: str, husband: str, wife: str, married: date):
+        self.id = id
+        self.husband = husband
+        self.wife = wife
+        self.children: List[str] = []
+        self.married = married
+        self.divorced: Optional[date] = None
+
+
+class Tree:
+    def __init__(self):
+        self.individuals: List[Individual] = []
+        self.families: List[Family] = []
+
+    def new_individual(self, surname: str, sex: str, birth: Union[date, str, None], death: Union[date, str, None] = None,
+                       given: str = None) -> Individual:
+        n = len(self.individuals) + 1
+        individual = Individual("@I{}@".format(n), given or "Given{}".format(n), surname, sex, birth, death)
+        self.individuals.append(individual)
+        return individual
+
+    def new_family(self, husband: Individual, wife: Individual, married: Optional[date],
+                   divorced: Optional[date] = None) -> Family:
+        family = Family("@F{}@".format(len(self.families) + 1), husband.id, wife.id, married)
+        family.divorced = divorced
+        self.families.append(family)
+        husband.fams.append(family.id)
+        wife.fams.append(family.id)
+        return family
+
+    def add_child(self, family: Family, child: Individual):
+        child.famc = family.id
+        family.children.append(child.id)
+
+
+def gedcom_date(d: Union[date, str]) -> str:
+    """Format a date like the GEDCOM files do, strings (e.g. illegitimate dates) are written as they are"""
+    if isinstance(d, str):
+        return d
+    return "{} {} {}".format(d.day, MONTHS[d.month - 1], d.year)
+
+
+def add_years(d: date, years: int, days: int = 0) -> date:
+    return date(d.year + years, d.month, min(d.day, 28)) + timedelta(days=days)
+
+
+def generate_tree(n_individuals: int, seed: int = 0) -> Tree:
+    """
+    Generate a family-tree without anomalies.
+    :param n_individuals: number of individuals of the tree
+    :param seed: seed of the random generator
+    """
+    rng = random.Random(seed)
+    tree = Tree()
+
+    def new_individual(surname: str, sex: str, birth: date) -> Individual:
+        # Die between 55 and 95, if that is before LAST_YEAR
+        death = add_years(birth, rng.randint(55, 95), rng.randint(0, 364))
+        return tree.new_individual(surname, sex, birth, death if death.year <= LAST_YEAR else None)
+
+    generation_size = max(2, n_individuals // GENERATIONS)
+    generation = [new_individual("Surname{}".format(rng.randint(1, max(1, generation_size // 4))), sex,
+                                 date(FIRST_YEAR + rng.randint(0, 9), 1, 1) + timedelta(days=rng.randint(0, 364)))
+                  for sex in (['M', 'F'] * generation_size)[:min(generation_size, n_individuals)]]
+
+    while len(tree.individuals) < n_individuals:
+        couples = pair_up(generation, rng)
+        remaining = n_individuals - len(tree.individuals)
+        # The last generation takes all remaining individuals, as long as the families stay small
+        size = remaining if remaining < 2 * generation_size else generation_size
+        size = min(size, MAX_CHILDREN * len(couples))
+        if not couples or size == 0:
+            # Nobody to have children, start over with new founders
+            generation = [new_individual("Surname{}".format(rng.randint(1, 1000)), rng.choice('MF'),
+                                         date(FIRST_YEAR + rng.randint(0, 9), 1, 1)
+                                         + timedelta(days=rng.randint(0, 364)))
+                          for _ in range(min(remaining, generation_size))]
+            continue
+        counts = [size // len(couples)] * len(couples)
+        for i in rng.sample(range(len(couples)), size % len(couples)):
+            counts[i] += 1
+
+        next_generation = []
+        for (husband, wife), count in zip(couples, counts):
+            married = add_years(max(husband.birth, wife.birth), rng.randint(20, 25), rng.randint(0, 364))
+            family = tree.new_family(husband, wife, married)
+            for i in range(count):
+                child = new_individual(husband.surname, rng.choice('MF'),
+                                       add_years(married, 1 + 2 * i, rng.randint(0, 300)))
+                tree.add_child(family, child)
+                next_generation.append(child)
+        generation = next_generation
+    return tree
+
+
+def pair_up(generation: List[Individual], rng: random.Random) -> List[tuple]:
+    """Marry the men and women of a generation, never siblings"""
+    men = [i for i in generation if i.sex == 'M']
+    women = [i for i in generation if i.sex == 'F']
+    rng.shuffle(men)
+    rng.shuffle(women)
+    couples = []
+    for man in men:
+        # Take one of the last few women who is not his sister (popping from the end is cheap)
+        for k in range(1, min(len(women), 3) + 1):
+            if man.famc is None or women[-k].famc != man.famc:
+                couples.append((man, women.pop(-k)))
+                break
+    return couples
+
+
+# Anomalies that can be injected, by the user story they violate. Every injection adds new individuals and families
+# that violate exactly the ERROR user stories it returns as (story id, id) findings: the id is the individual, family,
+# name (US23) or date (US42) the validator reports for that story.
+Injection = Callable[[Tree, random.Random], List[tuple]]
+
+
+def injection(story_id: str):
+    def register(inject: Injection) -> Injection:
+        injections[story_id] = inject
+        return inject
+    return register
+
+
+injections: Dict[str, Injection] = {}
+
+
+def some_day(rng: random.Random, year: int) -> date:
+    return date(year, rng.randint(1, 12), rng.randint(1, 28))
+
+
+def couple(tree: Tree, rng: random.Random, husband_born: int, wife_born: int, married: int,
+           husband_died: int = None, wife_died: int = None, divorced: int = None) -> Family:
+    """Add a husband and a wife (alive if no year of death is given) and their family"""
+    surname = "Surname{}".format(rng.randint(1, 1000))
+    husband = tree.new_individual(surname, 'M', some_day(rng, husband_born),
+                                  husband_died and some_day(rng, husband_died))
+    wife = tree.new_individual("Surname{}".format(rng.randint(1, 1000)), 'F', some_day(rng, wife_born),
+                               wife_died and some_day(rng, wife_died))
+    return tree.new_family(husband, wife, some_day(rng, married), divorced and some_day(rng, divorced))
+
+
+def child(tree: Tree, rng: random.Random, family: Family, born: Union[date, int], given: str = None,
+          surname: str = None) -> Individual:
+    """Add a child to family, with the surname of the father unless given"""
+    father = tree.individuals[int(family.husband[2:-1]) - 1]
+    c = tree.new_individual(surname or father.surname, rng.choice('MF'),
+                            born if isinstance(born, date) else some_day(rng, born), given=given)
+    tree.add_child(family, c)
+    return c
+
+
+@injection('US01')
+def inject_future_date(tree: Tree, rng: random.Random) -> List[tuple]:
+    individual = tree.new_individual("Surname1", rng.choice('MF'), some_day(rng, 2200))
+    return [('US01', individual.id)]
+
+
+@injection('US03')
+def inject_birth_after_death(tree: Tree, rng: random.Random) -> List[tuple]:
+    individual = tree.new_individual("Surname1", rng.choice('MF'), some_day(rng, 1950), some_day(rng, 1940))
+    return [('US03', individual.id)]
+
+
+@injection('US04')
+def inject_divorce_before_marriage(tree: Tree, rng: random.Random) -> List[tuple]:
+    family = couple(tree, rng, 1920, 1922, 1950, 1990, 1995, divorced=1945)
+    return [('US04', family.husband), ('US04', family.wife)]
+
+
+@injection('US05')
+def inject_marriage_after_death(tree: Tree, rng: random.Random) -> List[tuple]:
+    family = couple(tree, rng, 1900, 1905, 1945, 1940, 1990)
+    return [('US05', family.husband)]
+
+
+@injection('US06')
+def inject_divorce_after_death(tree: Tree, rng: random.Random) -> List[tuple]:
+    family = couple(tree, rng, 1900, 1905, 1930, 1950, 1990, divorced=1955)
+    return [('US06', family.husband)]
+
+
+@injection('US07')
+def inject_older_than_150(tree: Tree, rng: random.Random) -> List[tuple]:
+    individual = tree.new_individual("Surname1", rng.choice('MF'), some_day(rng, 1700), some_day(rng, 1860))
+    return [('US07', individual.id)]
+
+
+@injection('US08')
+def inject_birth_before_parents_married(tree: Tree, rng: random.Random) -> List[tuple]:
+    family = couple(tree, rng, 1920, 1922, 1960, 1990, 1995)
+    return [('US08', child(tree, rng, family, 1950).id)]
+
+
+@injection('US09')
+def inject_birth_after_father_died(tree: Tree, rng: random.Random) -> List[tuple]:
+    family = couple(tree, rng, 1900, 1905, 1930, 1950, 1990)
+    return [('US09', child(tree, rng, family, 1955).id)]
+
+
+@injection('US10')
+def inject_marriage_before_14(tree: Tree, rng: random.Random) -> List[tuple]:
+    family = couple(tree, rng, 1950, 1930, 1960)
+    return [('US10', family.husband)]
+
+
+@injection('US12')
+def inject_mother_too_old(tree: Tree, rng: random.Random) -> List[tuple]:
+    family = couple(tree, rng, 1920, 1900, 1965, None, 1990)
+    return [('US12', child(tree, rng, family, 1970).id)]
+
+
+@injection('US14')
+def inject_multiple_births(tree: Tree, rng: random.Random) -> List[tuple]:
+    family = couple(tree, rng, 1920, 1925, 1945, 1990, 1995)
+    birthday = some_day(rng, 1950)
+    for _ in range(6):
+        child(tree, rng, family, birthday)
+    return [('US14', family.id)]
+
+
+@injection('US15')
+def inject_15_siblings(tree: Tree, rng: random.Random) -> List[tuple]:
+    family = couple(tree, rng, 1890, 1895, 1914, 1970, 1975)
+    for year in range(1915, 1930):
+        child(tree, rng, family, year)
+    return [('US15', family.id)]
+
+
+@injection('US16')
+def inject_other_surname_than_father(tree: Tree, rng: random.Random) -> List[tuple]:
+    family = couple(tree, rng, 1920, 1922, 1945, 1990, 1995)
+    return [('US16', child(tree, rng, family, 1950, surname="Othername{}".format(rng.randint(1, 1000))).id)]
+
+
+@injection('US18')
+def inject_siblings_married(tree: Tree, rng: random.Random) -> List[tuple]:
+    parents = couple(tree, rng, 1900, 1902, 1925, 1970, 1975)
+    brother = child(tree, rng, parents, 1930)
+    brother.sex = 'M'
+    sister = child(tree, rng, parents, 1932)
+    sister.sex = 'F'
+    return [('US18', tree.new_family(brother, sister, some_day(rng, 1955)).id)]
+
+
+@injection('US21')
+def inject_female_husband(tree: Tree, rng: random.Random) -> List[tuple]:
+    family = couple(tree, rng, 1920, 1922, 1945, 1990, 1995)
+    tree.individuals[int(family.husband[2:-1]) - 1].sex = 'F'
+    return [('US21', family.husband)]
+
+
+@injection('US22')
+def inject_duplicate_id(tree: Tree, rng: random.Random) -> List[tuple]:
+    individual = tree.new_individual("Surname1", rng.choice('MF'), some_day(rng, 1960))
+    duplicate = tree.new_individual("Surname2", rng.choice('MF'), some_day(rng, 1961))
+    duplicate.id = individual.id
+    return [('US22', individual.id)]
+
+
+@injection('US23')
+def inject_same_name_and_birthday(tree: Tree, rng: random.Random) -> List[tuple]:
+    birthday = some_day(rng, 1960)
+    first = tree.new_individual("Surname1", 'F', birthday)
+    second = tree.new_individual("Surname1", 'F', birthday, given=first.given)
+    return [('US23', second.name)]
+
+
+@injection('US25')
+def inject_same_first_name_in_family(tree: Tree, rng: random.Random) -> List[tuple]:
+    family = couple(tree, rng, 1920, 1922, 1945, 1990, 1995)
+    birthday = some_day(rng, 1950)
+    first = child(tree, rng, family, birthday)
+    second = child(tree, rng, family, birthday, given=first.given)
+    # Same name and birthday in the whole file as well
+    return [('US25', second.id), ('US23', second.name)]
+
+
+@injection('US42')
+def inject_illegitimate_date(tree: Tree, rng: random.Random) -> List[tuple]:
+    birthday = "30 FEB {}".format(rng.randint(1900, 2000))
+    tree.new_individual("Surname1", rng.choice('MF'), birthday)
+    return [('US42', birthday)]
+
+
+def inject_anomalies(tree: Tree, counts: Dict[str, int], seed: int = 0) -> List[Dict[str, str]]:
+    """
+    Add anomalies to tree.
+    :param counts: how many anomalies to inject, by user story (see injections)
+    :param seed: seed of the random generator
+    :return: ground truth: every finding the validator should report for the injected anomalies, as dicts with the
+             story id and the reported id (individual, family, name or date)
+    """
+    rng = random.Random(seed)
+    manifest = []
+    for story_id, count in counts.items():
+        for _ in range(count):
+            manifest += [{'story': story, 'id': id} for story, id in injections[story_id](tree, rng)]
+    return manifest
+
+
+def parse_counts(text: str) -> Dict[str, int]:
+    """Parse anomaly counts like "US01=3,US09=1" or "all=2" (2 of every kind)"""
+    counts = {}
+    for item in text.split(","):
+        story_id, count = item.split("=")
+        story_id = story_id.strip().upper()
+        if story_id == "ALL":
+            counts.update((s, int(count)) for s in injections)
+        elif story_id in injections:
+            counts[story_id] = int(count)
+        else:
+            raise argparse.ArgumentTypeError("no anomaly for {}, known: {}".format(story_id, ", ".join(injections)))
+    return counts
+
+
+def write_gedcom(tree: Tree, filename: str):
+    """Write tree as a GEDCOM file"""
+    with open(filename, 'w') as f:
+        f.write("0 HEAD\n0 NOTE generated by generateGedcom.py\n")
+        for i in tree.individuals:
+            lines = ["0 {} INDI".format(i.id), "1 NAME " + i.name, "1 SEX " + i.sex]
+            if i.birth is not None:
+                lines += ["1 BIRT", "2 DATE " + gedcom_date(i.birth)]
+            if i.death is not None:
+                lines += ["1 DEAT", "2 DATE " + gedcom_date(i.death)]
+            if i.famc is not None:
+                lines.append("1 FAMC " + i.famc)
+            lines += ["1 FAMS " + fam for fam in i.fams]
+            f.write("\n".join(lines) + "\n")
+        for fam in tree.families:
+            lines = ["0 {} FAM".format(fam.id), "1 HUSB " + fam.husband, "1 WIFE " + fam.wife]
+            lines += ["1 CHIL " + child for child in fam.children]
+            if fam.married is not None:
+                lines += ["1 MARR", "2 DATE " + gedcom_date(fam.married)]
+            if fam.divorced is not None:
+                lines += ["1 DIV", "2 DATE " + gedcom_date(fam.divorced)]
+            f.write("\n".join(lines) + "\n")
+        f.write("0 TRLR\n")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Generate a synthetic GEDCOM file")
+    arg_parser.add_argument("individuals", type=int, help="number of individuals (without injected anomalies)")
+    arg_parser.add_argument("output", help="path of the GEDCOM file to write")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--anomalies", type=parse_counts, default={}, metavar="US01=3,US09=1|all=N",
+                            help="anomalies to inject, by user story")
+    arg_parser.add_argument("--manifest", help="where to write the ground truth of the injected anomalies as JSON "
+                                               "(default: <output>.manifest.json)")
+    args = arg_parser.parse_args()
+    tree = generate_tree(args.individuals, args.seed)
+    manifest = inject_anomalies(tree, args.anomalies, args.seed)
+    write_gedcom(tree, args.output)
+    if args.anomalies:
+        counts = {}
+        for finding in manifest:
+            counts[finding['story']] = counts.get(finding['story'], 0) + 1
+        with open(args.manifest or args.output + ".manifest.json", 'w') as f:
+            json.dump({'file': os.path.basename(args.output), 'individuals': len(tree.individuals), 'seed': args.seed,
+                       'injected': args.anomalies, 'counts': counts, 'findings': manifest}, f, indent=2)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Validates many GEDCOM files on a pool of worker processes. Every worker imports pandas and registers the user stories
+# once (with its first file) and then validates one file after another, writing the output of every file to its own
+# result file (what validate.py would print for it). A file that can not be validated is reported as failed in the
+# summary, the others are validated anyway.
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Optional, Set
+
+import pandas as pd
+
+from gedcomParser.parseCache import ParseCache, DEFAULT_MAX_BYTES
+from registry import parse_story_ids
+from report import writers
+from utils import tabulate_df
+
+# Extension of the result files by output format
+extensions = {'text': '.txt', 'jsonl': '.jsonl', 'csv': '.csv'}
+
+
+def find_gedcom_files(paths: List[str]) -> List[str]:
+    """
+    :param paths: GEDCOM files, directories (all .ged files in them) or glob patterns
+    :return: the GEDCOM files, each once, in the given order (sorted within a directory or pattern)
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.ged'))))
+        elif glob.has_magic(path):
+            files.extend(sorted(f for f in glob.glob(path, recursive=True) if os.path.isfile(f)))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+def result_paths(files: List[str], output_dir: str, output_format: str) -> List[str]:
+    """:return: one result file per input in output_dir, named after the input (numbered if names repeat)"""
+    paths, used = [], set()
+    for filename in files:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        candidate, number = name, 1
+        while candidate in used:
+            number += 1
+            candidate = "{}_{}".format(name, number)
+        used.add(candidate)
+        paths.append(os.path.join(output_dir, candidate + extensions[output_format]))
+    return paths
+
+
+def validate_file(filename: str, output: str, output_format: str = 'text', only: Optional[Set[str]] = None,
+                  skip: Optional[Set[str]] = None, cache_dir: Optional[str] = None,
+                  cache_size: int = DEFAULT_MAX_BYTES) -> Dict[str, Any]:
+    """
+    Validate one file, writing what validate.py prints to output.
+    Never raises, an exception is returned as status 'failed' with its error and traceback.
+    :return: file, output, status, seconds, number of anomalies in total and by story id, error, traceback
+    """
+    # imports the validator (pandas and all user stories) with the first file of a worker process only, later files
+    # find it in sys.modules
+    import validate
+    result = {'file': filename, 'output': output, 'status': 'ok', 'seconds': None, 'anomalies': 0, 'stories': {},
+              'error': None, 'traceback': None}
+    start = time.perf_counter()
+    try:
+        cache = ParseCache(cache_dir, cache_size) if cache_dir else None
+        with open(output, 'w') as f, redirect_stdout(f):
+            counts = validate.run_all_checks(filename, only=only, skip=skip, output_format=output_format, cache=cache)
+        result['stories'] = dict(sorted(counts.items()))
+        result['anomalies'] = sum(counts.values())
+    except Exception as e:
+        result.update(status='failed', error="{}: {}".format(type(e).__name__, e), traceback=traceback.format_exc())
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def run_batch(files: List[str], output_dir: str, jobs: int = None, output_format: str = 'text',
+              only: Optional[Set[str]] = None, skip: Optional[Set[str]] = None, cache_dir: Optional[str] = None,
+              cache_size: int = DEFAULT_MAX_BYTES) -> List[Dict[str, Any]]:
+    """
+    Validate files on jobs worker processes (default: one per CPU) and write summary.json to output_dir.
+    :return: the result of every file (see validate_file), in the order of files
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = result_paths(files, output_dir, output_format)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(validate_file, filename, output, output_format, only, skip, cache_dir, cache_size)
+                   for filename, output in zip(files, outputs)]
+        results = []
+        for filename, output, future in zip(files, outputs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # the worker died (e.g. killed by the OS for using too much memory)
+                results.append({'file': filename, 'output': output, 'status': 'failed', 'seconds': None,
+                                'anomalies': 0, 'stories': {}, 'error': "{}: {}".format(type(e).__name__, e),
+                                'traceback': None})
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump({'files': len(results), 'failed': sum(r['status'] == 'failed' for r in results),
+                   'anomalies': sum(r['anomalies'] for r in results), 'results': results}, f, indent=2)
+    return results
+
+
+def summary(results: List[Dict[str, Any]]) -> str:
+    """:return: table with one row per file: status, seconds, number of anomalies and the error of failed files"""
+    df = pd.DataFrame(results, columns=['file', 'status', 'seconds', 'anomalies', 'error'])
+    return tabulate_df(df.fillna(''))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Validate many GEDCOM files on a pool of processes")
+    arg_parser.add_argument("paths", nargs="+", metavar="<gedcom file, directory or glob>")
+    arg_parser.add_argument("--output-dir", required=True, metavar="DIR",
+                            help="directory for the result files (one per input) and summary.json")
+    arg_parser.add_argument("--jobs", type=int, default=None, metavar="N",
+                            help="number of worker processes (default: one per CPU)")
+    arg_parser.add_argument("--only", type=parse_story_ids, metavar="US01,US02,...",
+                            help="run only these user stories")
+    arg_parser.add_argument("--skip", type=parse_story_ids, metavar="US13,...", help="do not run these user stories")
+    arg_parser.add_argument("--format", choices=sorted(writers), default="text", dest="output_format",
+                            help="format of the result files (see validate.py)")
+    arg_parser.add_argument("--cache-dir", metavar="DIR", help="parse cache shared by all workers (see validate.py)")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // 2 ** 20, metavar="MB")
+    args = arg_parser.parse_args()
+    import validate
+    unknown = validate.unknown_story_ids(args.only, args.skip)
+    if unknown:
+        arg_parser.error("unknown user stories: " + ", ".join(sorted(unknown)))
+    files = find_gedcom_files(args.paths)
+    if not files:
+        arg_parser.error("no GEDCOM files found")
+    results = run_batch(files, args.output_dir, args.jobs, args.output_format, args.only, args.skip, args.cache_dir,
+                        args.cache_size * 2 ** 20)
+    print(summary(results))
+    sys.exit(1 if any(r['status'] == 'failed' for r in results) else 0)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import threading
+from typing import Any, Callable, Dict, Union
+
+import pandas as pd
+
+from utils import join_by_spouse, join_by_child, join_both_spouses_to_family, FamilyGraph, \
+    FamilyLinks
+
+
+class ValidationContext:
+    """
+    Wraps the individuals and families data-frames of one GEDCOM file and computes every derived table
+    (the joins in utils) once, on first access, so that all user stories share them.
+    Derived tables are shared between user stories and must not be modified in place.
+    """
+
+    def __init__(self, indivs_df: pd.DataFrame, families_df: pd.DataFrame = None):
+        self.indivs_df = indivs_df
+        self.families_df = families_df
+        self._tables: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    @staticmethod
+    def of(indivs_df: Union[pd.DataFrame, 'ValidationContext'], families_df: pd.DataFrame = None) \
+            -> 'ValidationContext':
+        """
+        Helper function so user stories accept either a context or the raw data-frames.
+        :param indivs_df: Individuals dataframe or a ValidationContext
+        :param families_df: Families dataframe (ignored if indivs_df already is a context)
+        :return: indivs_df if it is a context, a new context wrapping both data-frames otherwise
+        """
+        if isinstance(indivs_df, ValidationContext):
+            return indivs_df
+        return ValidationContext(indivs_df, families_df)
+
+    def table(self, name: str, compute: Callable[[], Any]) -> Any:
+        """
+        Return the derived table called name, computing it with compute() on first access.
+        Safe to call from several threads: every table is computed exactly once.
+        """
+        if name in self._tables:
+            return self._tables[name]
+        with self._locks_lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._tables:
+                self._tables[name] = compute()
+        return self._tables[name]
+
+    def derived(self, name: str) -> Any:
+        """
+        :param name: name of a derived table, i.e. of one of the memoized methods below
+        :return: the derived table
+        """
+        return getattr(self, name)()
+
+    def join_by_spouse(self) -> pd.DataFrame:
+        """Memoized utils.join_by_spouse"""
+        return self.table('join_by_spouse', lambda: join_by_spouse(self.indivs_df, self.families_df))
+
+    def join_by_child(self) -> pd.DataFrame:
+        """Memoized utils.join_by_child"""
+        return self.table('join_by_child', lambda: join_by_child(self.indivs_df, self.families_df))
+
+    def join_both_spouses_to_family(self) -> pd.DataFrame:
+        """Memoized utils.join_both_spouses_to_family"""
+        return self.table('join_both_spouses_to_family',
+                          lambda: join_both_spouses_to_family(self.indivs_df, self.families_df))
+
+    def family_links(self) -> FamilyLinks:
+        """Memoized utils.FamilyLinks of the families"""
+        return self.table('family_links', lambda: FamilyLinks(self.families_df))
+
+    def family_graph(self) -> FamilyGraph:
+        """Memoized utils.FamilyGraph of the families"""
+        return self.table('family_graph', lambda: FamilyGraph(self.families_df, self.family_links()))
+
+
+# Type of the first argument of user stories
+IndivsOrContext = Union[pd.DataFrame, ValidationContext]
@@ -1,51 +1,282 @@
 from . import fileToDicts
+from .parseCache import ParseCache, ParsedFile
 import pandas as pd
+from pandas.api.types import CategoricalDtype
 import sys
 from tabulate import tabulate
-from typing import Tuple
+from typing import Callable, Iterable, List, Tuple
 import numpy as np
-from dateutil.parser import parse as parse_date
-from dateutil.relativedelta import relativedelta
 from datetime import date
+from profiler import stage_of
 
 
-indivs_columns = ['ID', 'NAME', 'GENDER', 'BIRTHDAY', 'AGE', 'AGE_in_days', 'ALIVE', 'DEATH', 'CHILD', 'SPOUSE']
-fams_columns = ['ID', 'MARRIED', 'DIVORCED', 'HUSBAND ID', 'HUSBAND NAME', 'WIFE ID', 'WIFE NAME', 'CHILDREN']
+# Columns shown in the individuals / families tables
+indivs_display_columns = ['ID', 'NAME', 'GENDER', 'BIRTHDAY', 'AGE', 'AGE_in_days', 'ALIVE', 'DEATH', 'CHILD', 'SPOUSE']
+fams_display_columns = ['ID', 'MARRIED', 'DIVORCED', 'HUSBAND ID', 'HUSBAND NAME', 'WIFE ID', 'WIFE NAME', 'CHILDREN']
 
+# Date columns that are additionally stored parsed (<DATE>_DT, day numbers - see to_day_numbers) together with how
+# precise the date in the file was (<DATE>_PRECISION, one of DAY, MONTH, YEAR - see fileToDicts.date_precision)
+indivs_date_columns = ['BIRTHDAY', 'DEATH']
+fams_date_columns = ['MARRIED', 'DIVORCED']
 
-def parseFileToDFs(filename: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
-    indivs, families = fileToDicts.parseFile(filename)
-    indivs_df = pd.DataFrame(indivs)
-    families_df = pd.DataFrame(families)
+# Columns holding ids of individuals or families (see compact_dfs)
+indivs_id_columns = ['ID', 'CHILD']
+fams_id_columns = ['ID', 'HUSBAND ID', 'WIFE ID']
 
-    if indivs_df.empty:
-        indivs_df = pd.DataFrame(columns=indivs_columns)
+MONTHS = {'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6, 'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10,
+          'NOV': 11, 'DEC': 12}
+# Day number 0
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def typed_date_columns(date_columns: List[str]) -> List[str]:
+    return [c + suffix for c in date_columns for suffix in ('_DT', '_PRECISION')]
+
+
+indivs_columns = indivs_display_columns + typed_date_columns(indivs_date_columns)
+fams_columns = fams_display_columns + typed_date_columns(fams_date_columns)
+
+
+def day_number(day: date) -> int:
+    """:return: the day number of a date or datetime (see to_day_numbers)"""
+    return int((np.datetime64(day, 'D') - EPOCH).astype(np.int64))
+
+
+def parse_day_number(text: str) -> float:
+    """:return: the day number of a GEDCOM date like '1 JAN 1990', NaN if it is no such date"""
+    try:
+        day, month, year = text.split()
+        return day_number(date(int(year), MONTHS[month], int(day)))
+    except (ValueError, KeyError):
+        return np.nan
+
+
+def to_day_numbers(dates: pd.Series) -> pd.Series:
+    """
+    Parse GEDCOM dates like '1 JAN 1990' (as completed by the parser) into day numbers: the days since 1 JAN 1970 as
+    floats, NaN for missing dates. Unlike datetime64[ns], which ends in 1677 and 2262, day numbers cover every year a
+    GEDCOM date can have, and comparing or subtracting them compares or subtracts the dates.
+    """
+    present = dates.dropna().astype(str)
+    numbers = {text: parse_day_number(text) for text in pd.unique(present)}
+    return present.map(numbers).reindex(dates.index).astype(float)
+
+
+def calendar_of(days) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """:return: year, month (1 - 12) and day of the month of day numbers (which must not be NaN)"""
+    days = EPOCH + np.asarray(days, dtype=np.int64)
+    months = days.astype('datetime64[M]')
+    return (months.astype('datetime64[Y]').astype(np.int64) + 1970, months.astype(np.int64) % 12 + 1,
+            (days - months.astype('datetime64[D]')).astype(np.int64) + 1)
+
+
+def from_calendar(year, month, day, clamp: bool = False) -> np.ndarray:
+    """
+    :param clamp: days beyond the end of the month are the last day of the month (like in relativedelta) instead of
+                  NaN
+    :return: day numbers of the dates, NaN for days that do not exist
+    """
+    first = (np.asarray((np.asarray(year) - 1970) * 12 + np.asarray(month) - 1, dtype=np.int64)
+             .astype('datetime64[M]').astype('datetime64[D]'))
+    length = days_in_month(year, month)
+    day = np.asarray(day, dtype=np.int64)
+    days = (first - EPOCH).astype(np.int64) + np.minimum(day, length) - 1
+    return np.where(clamp | (day <= length), days, np.nan)
+
+
+def days_in_month(year, month) -> np.ndarray:
+    """:return: the number of days in the months (1 - 12, overflowing into the following years) of the years"""
+    first = np.asarray((np.asarray(year) - 1970) * 12 + np.asarray(month) - 1, dtype=np.int64).astype('datetime64[M]')
+    return ((first + 1).astype('datetime64[D]') - first.astype('datetime64[D]')).astype(np.int64)
+
+
+def add_months(days: pd.Series, months: int) -> pd.Series:
+    """:return: day numbers months after days (the last day of the month if the day does not exist in it)"""
+    known = days.notna().values
+    year, month, day = calendar_of(days.values[known])
+    shifted = np.full(len(days), np.nan)
+    shifted[known] = from_calendar(year, month + months, day, clamp=True)
+    return pd.Series(shifted, index=days.index)
+
+
+def years_between(start: pd.Series, end: pd.Series) -> pd.Series:
+    """
+    Vectorized equivalent of relativedelta(end, start).years on day numbers: the number of full years from start to
+    end, negative if end is before start, NaN if either date is missing.
+    """
+    start, end = pd.Series(start, dtype=float), pd.Series(end, dtype=float)
+    known = (start.notna() & end.notna()).values
+    start_year, start_month, start_day = calendar_of(start.values[known])
+    end_year, end_month, end_day = calendar_of(end.values[known])
+    forward = end.values[known] >= start.values[known]
+    # relativedelta moves start by whole months, clamping the day to the end of the month, and backs off one month
+    # if that overshoots end
+    day_reached = np.minimum(start_day, days_in_month(end_year, end_month))
+    months = (end_year - start_year) * 12 + end_month - start_month
+    months = np.where(forward, months - (end_day < day_reached), months + (end_day > day_reached))
+    years = np.where(forward, months // 12, -(-months // 12))
+    result = np.full(len(start), np.nan)
+    result[known] = years
+    return whole_numbers(pd.Series(result, index=start.index))
+
+
+def days_between(start: pd.Series, end: pd.Series) -> pd.Series:
+    """Vectorized number of days from start to end (day numbers), NaN if either date is missing"""
+    return whole_numbers(pd.Series(np.asarray(end, dtype=float) - np.asarray(start, dtype=float), index=start.index))
+
+
+def whole_numbers(numbers: pd.Series) -> pd.Series:
+    """:return: numbers as integers, unless some are NaN (like pandas arithmetic on integer columns)"""
+    return numbers if numbers.isna().any() else numbers.astype(np.int64)
+
+
+def parseFileToDFs(filename: str, today: date = None, on_illegitimate_date: Callable[[str], None] = None,
+                   profiler=None, cache: ParseCache = None, compact: bool = False) \
+        -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    :param today: reference date for AGE, AGE_in_days and ALIVE (defaults to date.today())
+    :param on_illegitimate_date: called with every date rejected by US42 (defaults to printing an error)
+    :param profiler: profiler.Profiler measuring the parsing stages (see recordsToDFs)
+    :param cache: if given, a file parsed before is read from the cache instead, only its ages are computed again
+    :param compact: store the columns in compact dtypes (see compact_dfs)
+    """
+    if cache is None:
+        dfs = recordsToDFs(fileToDicts.parseRecords(filename, on_illegitimate_date), today, profiler)
     else:
-        # Add missing columns
-        for col in indivs_columns:
-            if col not in indivs_df.columns:
-                indivs_df[col] = np.nan
-        # Calculate age
-        indivs_df['AGE'] = [None if pd.isna(birth) else
-                relativedelta(date.today() if pd.isna(death) else parse_date(death), parse_date(birth)).years
-                for birth, death in zip(indivs_df['BIRTHDAY'], indivs_df['DEATH'])]
-        indivs_df['AGE_in_days'] = [None if pd.isna(birth) else
-                            ((date.today() if pd.isna(death) else parse_date(death).date()) - parse_date(birth).date()).days
-                            for birth, death in zip(indivs_df['BIRTHDAY'], indivs_df['DEATH'])]
-        # Calculate alive
-        indivs_df['ALIVE'] = [pd.isna(death) or parse_date(death).date() > date.today()
-                for death in indivs_df['DEATH']]
-        # Reorder columns
-        indivs_df = indivs_df[indivs_columns]
-
-    if families_df.empty:
-        families_df = pd.DataFrame(columns=fams_columns)
+        dfs = parse_cached(filename, today, on_illegitimate_date, profiler, cache)
+    if compact:
+        stage = stage_of(profiler)
+        with stage('compact', len(dfs[0]) + len(dfs[1])) as profile:
+            dfs = compact_dfs(*dfs)
+            profile.rows_out = len(dfs[0]) + len(dfs[1])
+    return dfs
+
+
+def parse_cached(filename: str, today: date, on_illegitimate_date: Callable[[str], None], profiler,
+                 cache: ParseCache) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """parseFileToDFs() with a cache"""
+    stage = stage_of(profiler)
+    report = on_illegitimate_date or fileToDicts.print_illegitimate_date
+    with stage('cache') as profile:
+        key = cache.key(filename)
+        parsed = cache.get(key)
+        profile.rows_out = None if parsed is None else len(parsed.indivs_df) + len(parsed.families_df)
+    if parsed is None:
+        illegitimate_dates = []
+
+        def on_date(text: str):
+            illegitimate_dates.append(text)
+            report(text)
+
+        indivs_df, families_df = recordsToUnagedDFs(fileToDicts.parseRecords(filename, on_date), profiler)
+        cache.put(key, ParsedFile(indivs_df, families_df, illegitimate_dates))
     else:
-        # Add missing columns
-        for col in fams_columns:
-            if col not in families_df:
-                families_df[col] = np.nan
-        # Reorder columns
-        families_df = families_df[fams_columns]
+        indivs_df, families_df = parsed.indivs_df, parsed.families_df
+        for text in parsed.illegitimate_dates:
+            report(text)
+    return finish_dfs(indivs_df, families_df, today, profiler)
+
+
+def recordsToDFs(records: Iterable[Tuple[str, dict]], today: date = None, profiler=None) \
+        -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Build the individuals and families data-frames from a stream of ("INDI"|"FAM", record) tuples,
+    consuming the records one at a time as they are parsed.
+    :param today: reference date for AGE, AGE_in_days and ALIVE (defaults to date.today())
+    :param profiler: profiler.Profiler measuring the stages records (reading and parsing the file), data-frames,
+                     dates and ages
+    """
+    return finish_dfs(*recordsToUnagedDFs(records, profiler), today, profiler)
 
+
+def recordsToUnagedDFs(records: Iterable[Tuple[str, dict]], profiler=None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Like recordsToDFs, but without the columns depending on the reference date (see finish_dfs), so that the result
+    can be cached.
+    """
+    stage = stage_of(profiler)
+    with stage('records') as profile:
+        indivs, families = fileToDicts.collectRecords(records)
+        rows = len(indivs) + len(families)
+        profile.rows_out = rows
+    with stage('data-frames', rows) as profile:
+        indivs_df = records_to_df(indivs, indivs_columns)
+        families_df = records_to_df(families, fams_columns)
+        profile.rows_out = rows
+    with stage('dates', rows) as profile:
+        add_datetime_columns(indivs_df, indivs_date_columns)
+        add_datetime_columns(families_df, fams_date_columns)
+        profile.rows_out = rows
     return indivs_df, families_df
+
+
+def finish_dfs(indivs_df: pd.DataFrame, families_df: pd.DataFrame, today: date = None, profiler=None) \
+        -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Add the age columns (in place) and put the columns into their display order"""
+    stage = stage_of(profiler)
+    with stage('ages', len(indivs_df)) as profile:
+        if not indivs_df.empty:
+            add_age_columns(indivs_df, date.today() if today is None else today)
+        profile.rows_out = len(indivs_df)
+    # Reorder columns
+    return indivs_df[indivs_columns], families_df[fams_columns]
+
+
+def compact_dfs(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Convert the columns to compact dtypes. The ids (ID, CHILD, HUSBAND ID, WIFE ID) become categoricals that share one
+    CategoricalDtype, so their integer codes are interned ids with dtype.categories as the lookup table, and merges of
+    id columns run on the codes. The names share another CategoricalDtype. GENDER, the dates as written in the file and
+    their precisions become categories. AGE and AGE_in_days keep their dtype (float with NaN for missing ages if there
+    are any), and SPOUSE and CHILDREN stay sets.
+    """
+    ids = shared_categories([indivs_df[c] for c in indivs_id_columns] + [families_df[c] for c in fams_id_columns])
+    names = shared_categories([indivs_df['NAME'], families_df['HUSBAND NAME'], families_df['WIFE NAME']])
+    dates = indivs_date_columns + [c + '_PRECISION' for c in indivs_date_columns]
+    indivs_df = indivs_df.astype({**{c: ids for c in indivs_id_columns}, 'NAME': names, 'GENDER': 'category',
+                                  **{c: 'category' for c in dates}})
+    dates = fams_date_columns + [c + '_PRECISION' for c in fams_date_columns]
+    families_df = families_df.astype({**{c: ids for c in fams_id_columns}, 'HUSBAND NAME': names,
+                                      'WIFE NAME': names, **{c: 'category' for c in dates}})
+    return indivs_df, families_df
+
+
+def shared_categories(columns: List[pd.Series]) -> CategoricalDtype:
+    """:return: categorical dtype with every value of the columns as category (in order of appearance)"""
+    values = pd.unique(np.concatenate([c.dropna().values.astype(object) for c in columns]))
+    return CategoricalDtype(values)
+
+
+def records_to_df(records: List[dict], columns: List[str]) -> pd.DataFrame:
+    """:return: data-frame of the records with all columns, missing ones filled with NaN"""
+    if not records:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame(records)
+    # Add missing columns
+    for col in columns:
+        if col not in df.columns:
+            df[col] = np.nan
+    return df
+
+
+def add_age_columns(indivs_df: pd.DataFrame, today: date):
+    """
+    Calculate AGE (in years), AGE_in_days and ALIVE for all individuals at once.
+    The age of the living is taken at today, the age of the dead at their death.
+    Individuals without a birthday get no age.
+    """
+    today = day_number(today)
+    birth = indivs_df['BIRTHDAY_DT']
+    death = indivs_df['DEATH_DT']
+    # an unparseable death date still means the individual died, only at an unknown date
+    died = indivs_df['DEATH'].notna()
+    end = death.where(died, today)
+    indivs_df['AGE'] = years_between(birth, end)
+    indivs_df['AGE_in_days'] = days_between(birth, end)
+    indivs_df['ALIVE'] = ~died | (death > today)
+
+
+def add_datetime_columns(df: pd.DataFrame, date_columns: List[str]):
+    """Parse every date column once into its typed <DATE>_DT column (day numbers)"""
+    for col in date_columns:
+        df[col + '_DT'] = to_day_numbers(df[col])
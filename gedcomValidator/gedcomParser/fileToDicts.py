@@ -1,76 +1,105 @@
 # Description:
+# GedcomParser keeps all state of a single parse on the instance, so several files can be parsed
+# at the same time (e.g. from a thread pool) with one parser per file:
+#
 # last_level_0 and last_level_1 are used to track what the last tag of that
 # level was (for purposes of detecting context)
 #
 # cur_individual and cur_family are used to build an individual or family entry
 #
 # individual_list and family_list hold all individual and family entries
+#
+# repaired_backlinks counts the CHIL links that were missing from a family and added after parsing
+#
+# individuals_by_id indexes individual_list by id, so that the names of husband and wife
+# can be filled in with one lookup each after all records have been read
+#
+# on_illegitimate_date is called with the text of every date rejected by US42 (prints an error by default)
+#
+# parseFile(), parseRecords() and collectRecords() are module level wrappers that use a fresh parser per call
+#
+# tokenize() splits the lines of a file into tokens, the parser dispatches every line on its level (level_parsers) and
+# its tag (LEVEL_0_TAGS, LEVEL_1_TAGS, DATE_CONTEXTS)
 
 
 import sys
-import re
+import codecs
 import datetime
+import mmap
+import os
+import re
 import numpy as np
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+# Tags accepted at level 0
+LEVEL_0_TAGS = frozenset(["INDI", "FAM", "HEAD", "TRLR", "NOTE"])
+# Tags accepted at level 1: the level 0 tag of the record they belong to and the name of their parse method
+LEVEL_1_TAGS = {
+    "NAME": ("INDI", "parse_name"),
+    "SEX": ("INDI", "parse_sex"),
+    "BIRT": ("INDI", "parse_birt_deat_marr_div"),
+    "DEAT": ("INDI", "parse_birt_deat_marr_div"),
+    "FAMC": ("INDI", "parse_famc_fams_husb_wife_chil"),
+    "FAMS": ("INDI", "parse_famc_fams_husb_wife_chil"),
+    "MARR": ("FAM", "parse_birt_deat_marr_div"),
+    "DIV": ("FAM", "parse_birt_deat_marr_div"),
+    "HUSB": ("FAM", "parse_famc_fams_husb_wife_chil"),
+    "WIFE": ("FAM", "parse_famc_fams_husb_wife_chil"),
+    "CHIL": ("FAM", "parse_famc_fams_husb_wife_chil"),
+}
+# Level 1 tags a level 2 DATE belongs to
+DATE_CONTEXTS = frozenset(["BIRT", "DEAT", "DIV", "MARR"])
+
+# Maps every byte that does not belong to a token to a space: tokens are made of the characters matched by [\w.*/@]
+# and of all non-ASCII bytes (UTF-8 encoded letters). Line breaks are kept to split the lines.
+SEPARATORS = bytes(b if chr(b).isalnum() or chr(b) in "_.*/@\r\n" or b >= 0x80 else ord(" ") for b in range(256))
+# Line breaks as in python's universal newlines mode: \n, \r\n or a lone \r
+LINE_BREAK = re.compile(rb"\r\n?|\n")
+CHUNK_SIZE = 2 ** 20
+
+
+def tokenize(filename: str) -> Iterator[List[str]]:
+    """
+    Split the lines of a file into tokens, like re.sub("[^\\w.*/@]", " ", line).split() but with one translate and one
+    decode per chunk of CHUNK_SIZE bytes instead of a regular expression per line. The file is memory mapped, so it is
+    never read into memory as a whole. Lines may end with \\n, \\r\\n or \\r, and empty lines are skipped.
+    """
+    with open(filename, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            size = len(data)
+            start = len(codecs.BOM_UTF8) if data[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+            while start < size:
+                # chunks end at the end of a line
+                line_break = LINE_BREAK.search(data, start + CHUNK_SIZE) if start + CHUNK_SIZE < size else None
+                end = line_break.end() if line_break else size
+                chunk = data[start:end].translate(SEPARATORS).replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+                for line in chunk.decode('utf-8', 'replace').split("\n"):
+                    tokens = line.split()
+                    if tokens:
+                        yield tokens
+                start = end
 
-last_level_0 = ""
-last_level_1 = ""
 
-cur_individual = {}
-cur_family = {}
+def parseFile(filename: str):
+    """main method"""
+    return GedcomParser().parseFile(filename)
 
-individual_list = []
-family_list = []
 
+def parseRecords(filename: str, on_illegitimate_date: Callable[[str], None] = None) -> Iterator[Tuple[str, dict]]:
+    """Lazily parse a GEDCOM file, see GedcomParser.parseRecords()"""
+    return GedcomParser(on_illegitimate_date).parseRecords(filename)
+
+
+def collectRecords(records: Iterable[Tuple[str, dict]]) -> Tuple[List[dict], List[dict]]:
+    """Collect a stream of records into lists of individuals and families, see GedcomParser.collectRecords()"""
+    return GedcomParser().collectRecords(records)
 
-def parseFile(filename: str):
-    """main method"""
-    # bring global variables into scope
-    global cur_individual
-    global cur_family
-    global individual_list
-    global family_list
-
-    # reset global variables
-    last_level_0 = ""
-    last_level_1 = ""
-    cur_individual = {}
-    cur_family = {}
-    individual_list = []
-    family_list = []
-
-    with open(filename) as file:
-        # strips file into lines
-        lines = [line.rstrip('\n') for line in file]
-        # parse each line
-        for line in lines:
-            # tokenizes line by spaces
-            line_tokens = re.sub("[^\w.*/@]", " ", line).split()
-            # prints line input
-            # print("-->", " ".join(str(e) for e in line_tokens))
-            # checks if it is a tag that we accept (if not, then prints generic "N" message)
-            if not is_level_zero_tag(line_tokens) and not is_level_one_tag(line_tokens) and not is_level_two_tag(
-                    line_tokens):
-                pass
-                # write_it(["<-- ", line_tokens[0], "|", line_tokens[1], "|N|", " ".join(str(e) for e in line_tokens[2:]), "\n"])
-        # appends current individual to individual_list
-        if cur_individual != {}:
-            individual_list.append(cur_individual)
-        # appends current family to family_list
-        if cur_family != {}:
-            family_list.append(cur_family)
-
-        for indi in individual_list:
-            # need to go through each individual and, for each family of which that individual
-            # is a child, check that it is in the family
-            # TODO isn't this a story?
-            cid = indi["CHILD"]
-            for family in family_list:
-                if cid == family["ID"]:
-                    if not "CHILDREN" in family:
-                        family.update({"CHILDREN": set()})
-                    if not indi["ID"] in family["CHILDREN"]:
-                        family["CHILDREN"].add(indi["ID"])
-        return individual_list, family_list
+
+def print_illegitimate_date(date: str):
+    """US42: report a rejected date on stdout"""
+    print("ERROR: PARSER: US42: DATE '{}' is illegitimate".format(date))
 
 
 # stupid function I wrote, not realizing that you can do something similar with regular print function.
@@ -82,292 +111,318 @@ def write_it(token_list):
     print("")
 
 
-# checks if tokens represent level zero tag, parsing the arguments for correctness
-def is_level_zero_tag(tokens):
-    global last_level_0
-    """Returns bool representing whether or not it is a valid level 0 tag"""
-    ret_val = False
-    # if first token is not a digit or is not equal to zero, it is a poorly formatted
-    # line and returns false
-    if not tokens[0].isdigit() or int(tokens[0]) != 0:
-        return ret_val
-    switch = {
-        "INDI": True,
-        "FAM": True,
-        "HEAD": True,
-        "TRLR": True,
-        "NOTE": True,
-    }
-    # checks if 2nd or 3rd token (index 1 or 2) is a valid tag, and then checks the corresponding arguments,
-    # updating last_level_0 appropriately
-    if switch.get(tokens[1], False):
-        if tokens[1] == "HEAD" or tokens[1] == "TRLR":
-            ret_val = parse_head_trlr(tokens)
-        if tokens[1] == "NOTE":
-            ret_val = parse_note(tokens)
-        last_level_0 = tokens[1]
-    elif len(tokens) == 3 and switch.get(tokens[2], False):
-        if tokens[2] == "INDI" or tokens[2] == "FAM":
-            ret_val = parse_indi_fam(tokens)
-        ret_val = True
-        last_level_0 = tokens[2]
-    return ret_val
-
-
-# checks if tokens represent level one tag, parsing the arguments for correctness
-def is_level_one_tag(tokens):
-    """Returns bool representing whether or not it is a valid level 1 tag"""
-    global last_level_1
-    ret_val = False
-    # if first token is not a digit or is not equal to zero, it is a poorly formatted
-    # line and returns false
-    if not tokens[0].isdigit() or int(tokens[0]) != 1:
-        return ret_val
-    switch = {
-        "NAME": True,
-        "SEX": True,
-        "BIRT": True,
-        "DEAT": True,
-        "FAMC": True,
-        "FAMS": True,
-        "MARR": True,
-        "HUSB": True,
-        "WIFE": True,
-        "CHIL": True,
-        "DIV": True,
-    }
-    # checks if 2nd or 3rd token (index 1 or 2) is a valid tag, and then checks the corresponding arguments,
-    # updating last_level_1 appropriately
-    #
-    # if it is a valid tag, it updates the cur_individual or cur_family variables appropriately according to
-    # context indicated by the last_level_0
-    if switch.get(tokens[1], False):
-        if tokens[1] == "NAME":
-            if last_level_0 == "INDI":
-                ret_val = parse_name(tokens)
-                if ret_val:
-                    last_level_1 = tokens[1]
-            else:
-                ret_val = False
-        elif tokens[1] == "SEX":
-            if last_level_0 == "INDI":
-                ret_val = parse_sex(tokens)
-                if ret_val:
-                    last_level_1 = tokens[1]
-            else:
-                ret_val = False
-        elif tokens[1] == "BIRT" or tokens[1] == "DEAT":
-            if last_level_0 == "INDI":
-                ret_val = parse_birt_deat_marr_div(tokens)
-                if ret_val:
-                    last_level_1 = tokens[1]
-            else:
-                ret_val = False
-        elif tokens[1] == "MARR" or tokens[1] == "DIV":
-            if last_level_0 == "FAM":
-                ret_val = parse_birt_deat_marr_div(tokens)
-                if ret_val:
-                    last_level_1 = tokens[1]
-            else:
-                ret_val = False
-        elif tokens[1] == "FAMC" or tokens[1] == "FAMS":
-            if last_level_0 == "INDI":
-                ret_val = parse_famc_fams_husb_wife_chil(tokens)
-                if ret_val:
-                    last_level_1 = tokens[1]
-            else:
-                ret_val = False
-        elif tokens[1] == "HUSB" or tokens[1] == "WIFE" or tokens[1] == "CHIL":
-            if last_level_0 == "FAM":
-                ret_val = parse_famc_fams_husb_wife_chil(tokens)
-                if ret_val:
-                    last_level_1 = tokens[1]
+class GedcomParser:
+    """
+    Parser for a single GEDCOM file. All parse state lives on the instance, so use one parser per file
+    (parsers are cheap) when parsing files concurrently.
+    """
+
+    def __init__(self, on_illegitimate_date: Callable[[str], None] = None):
+        self.on_illegitimate_date = print_illegitimate_date if on_illegitimate_date is None else on_illegitimate_date
+        self.last_level_0 = ""
+        self.last_level_1 = ""
+        self.cur_individual = {}
+        self.cur_family = {}
+        self.individual_list = []
+        self.family_list = []
+        self.individuals_by_id = {}
+        self.repaired_backlinks = 0
+        # parse method by level of the line
+        self.level_parsers = {0: self.is_level_zero_tag, 1: self.is_level_one_tag, 2: self.is_level_two_tag}
+        # level 1 tag -> level 0 tag of its record, bound parse method
+        self.level_1_parsers = {tag: (record_tag, getattr(self, method))
+                                for tag, (record_tag, method) in LEVEL_1_TAGS.items()}
+
+    def parseFile(self, filename: str):
+        """parses filename and returns the list of individuals and the list of families"""
+        return self.collectRecords(self.parseRecords(filename))
+
+    def collectRecords(self, records: Iterable[Tuple[str, dict]]) -> Tuple[List[dict], List[dict]]:
+        """
+        Consumes a stream of records as produced by parseRecords() and returns the list of individuals
+        and the list of families
+        """
+        self.individual_list = []
+        self.family_list = []
+        self.individuals_by_id = {}
+
+        for tag, record in records:
+            if tag == "INDI":
+                self.individual_list.append(record)
+                # the first individual with a given id wins, like the old linear lookup
+                self.individuals_by_id.setdefault(record["ID"], record)
             else:
-                ret_val = False
-    #    elif len(tokens) >= 3 and switch.get(tokens[2], False):
-    #        ret_val = True
-    return ret_val
-
-
-# checks if tokens represent level two tag, parsing the arguments for correctness
-def is_level_two_tag(tokens):
-    """Returns bool representing whether or not it is a valid level 2 tag"""
-    ret_val = False
-    # if first token is not a digit or is not equal to zero, it is a poorly formatted
-    # line and returns false
-    if not tokens[0].isdigit() or int(tokens[0]) != 2:
+                self.family_list.append(record)
+
+        self.resolve_spouse_names()
+        self.reconcile_child_backlinks()
+        return self.individual_list, self.family_list
+
+    def reconcile_child_backlinks(self) -> int:
+        """
+        need to go through each individual and, for each family of which that individual
+        is a child, check that it is in the family.
+        Families are looked up by id, so this is linear in the number of individuals and families.
+        :return: number of missing CHIL links that were added (also stored in repaired_backlinks)
+        """
+        # TODO isn't this a story?
+        families_by_id = {}
+        for family in self.family_list:
+            # ids might be duplicated (US22), so every family with the id gets the child
+            families_by_id.setdefault(family["ID"], []).append(family)
+
+        self.repaired_backlinks = 0
+        for indi in self.individual_list:
+            for family in families_by_id.get(indi["CHILD"], []):
+                if not "CHILDREN" in family:
+                    family.update({"CHILDREN": set()})
+                if not indi["ID"] in family["CHILDREN"]:
+                    family["CHILDREN"].add(indi["ID"])
+                    self.repaired_backlinks += 1
+        return self.repaired_backlinks
+
+    def resolve_spouse_names(self):
+        """fills in HUSBAND NAME and WIFE NAME of every family, regardless of the order of the records"""
+        for family in self.family_list:
+            if "HUSBAND ID" in family:
+                family["HUSBAND NAME"] = self.lookup_name(family["HUSBAND ID"])
+            if "WIFE ID" in family:
+                family["WIFE NAME"] = self.lookup_name(family["WIFE ID"])
+
+    def parseRecords(self, filename: str) -> Iterator[Tuple[str, dict]]:
+        """
+        Lazily parse a GEDCOM file line by line.
+        Yields ("INDI", individual) or ("FAM", family) as soon as the level 0 block of that record is closed,
+        so the whole file never has to be held in memory.
+        HUSBAND NAME and WIFE NAME are only filled in by collectRecords(), once all individuals are known.
+        """
+        # reset parse state
+        self.last_level_0 = ""
+        self.last_level_1 = ""
+        self.cur_individual = {}
+        self.cur_family = {}
+
+        # parse each line
+        for line_tokens in tokenize(filename):
+            # a new level 0 line closes the record that is currently being built
+            if line_tokens[0] == "0":
+                yield from self.close_records()
+            # prints line input
+            # print("-->", " ".join(str(e) for e in line_tokens))
+            # checks if it is a tag that we accept (if not, then prints generic "N" message)
+            if len(line_tokens) < 2 or not line_tokens[0].isdigit():
+                continue
+            parse_line = self.level_parsers.get(int(line_tokens[0]))
+            if parse_line is None or not parse_line(line_tokens):
+                pass
+                # write_it(["<-- ", line_tokens[0], "|", line_tokens[1], "|N|", " ".join(str(e) for e in line_tokens[2:]), "\n"])
+        # yields the last individual or family of the file
+        yield from self.close_records()
+
+    def close_records(self) -> Iterator[Tuple[str, dict]]:
+        """yields the current individual and/or family (if any) and starts over with empty ones"""
+        self.last_level_0 = ""
+        self.last_level_1 = ""
+        if self.cur_individual != {}:
+            yield "INDI", self.cur_individual
+            self.cur_individual = {}
+        if self.cur_family != {}:
+            yield "FAM", self.cur_family
+            self.cur_family = {}
+
+    # checks if tokens represent level zero tag, parsing the arguments for correctness
+    def is_level_zero_tag(self, tokens):
+        """Returns bool representing whether or not it is a valid level 0 tag"""
+        ret_val = False
+        # if first token is not a digit or is not equal to zero, it is a poorly formatted
+        # line and returns false
+        if not tokens[0].isdigit() or int(tokens[0]) != 0:
+            return ret_val
+        # checks if 2nd or 3rd token (index 1 or 2) is a valid tag, and then checks the corresponding arguments,
+        # updating last_level_0 appropriately
+        if tokens[1] in LEVEL_0_TAGS:
+            if tokens[1] == "HEAD" or tokens[1] == "TRLR":
+                ret_val = self.parse_head_trlr(tokens)
+            if tokens[1] == "NOTE":
+                ret_val = self.parse_note(tokens)
+            self.last_level_0 = tokens[1]
+        elif len(tokens) == 3 and tokens[2] in LEVEL_0_TAGS:
+            if tokens[2] == "INDI" or tokens[2] == "FAM":
+                ret_val = self.parse_indi_fam(tokens)
+            ret_val = True
+            self.last_level_0 = tokens[2]
         return ret_val
-    switch = {
-        "DATE": True,
-    }
-    # checks if 2nd token (index 1) is a valid tag, and then checks the corresponding arguments
-    #
-    # if it is a valid tag, it updates the cur_individual or cur_family variables appropriately according to
-    # context indicated by the last_level_1
-    if switch.get(tokens[1], False):
-        if tokens[1] == "DATE":
-            if last_level_1 == "BIRT" or last_level_1 == "DEAT" or last_level_1 == "DIV" or last_level_1 == "MARR":
-                ret_val = parse_date(tokens)
-    return ret_val
-
-
-# checks if it is a new individual or family. If it is, stores the appropriate old individual or family and creates a new one
-def parse_indi_fam(tokens):
-    """checks that 'INDI' or 'FAM' was in proper format"""
-    global cur_individual
-    global cur_family
-    global individual_list
-    global family_list
-    """checks that 'INDI' or 'FAM' was in proper format"""
-    if len(tokens) == 3 and (tokens[2] == "INDI" or tokens[2] == "FAM"):
-        # write_it(["<-- ", tokens[0], "|", tokens[2], "|Y|", tokens[1]])
-        if tokens[2] == "INDI":
-            # print("Individual: %s" % (cur_individual))
-            if bool(cur_individual):
-                individual_list.append(cur_individual)
-                cur_individual = {}
-            cur_individual["ID"] = tokens[1]
-            cur_individual["CHILD"] = None
-            cur_individual["SPOUSE"] = None
-        elif tokens[2] == "FAM":
-            # print("Family: %s" % (cur_family))
-            if bool(cur_family):
-                family_list.append(cur_family)
-                cur_family = {}
-            cur_family["ID"] = tokens[1]
-            cur_family["CHILDREN"] = set()
-        return True
-    # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", "".join(str(e) for e in tokens[2:])])
-    return False
-
-
-def parse_head_trlr(tokens):
-    """checks that 'HEAD' or 'TRLR' was in proper format"""
-    if (tokens[1] == "HEAD" or tokens[1] == "TRLR") and len(tokens) == 2:
-        # write_it(["<-- ", tokens[0], "|", tokens[1], "|Y|"])
-        return True
-    # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", "".join(str(e) for e in tokens[2:])])
-    return False
-
-
-def parse_note(tokens):
-    """checks that 'NOTE' was in proper format"""
-    if tokens[1] == "NOTE":
-        # write_it(["<-- ", tokens[0], "|", tokens[1], "|Y|"])
-        return True
-    # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", "".join(str(e) for e in tokens[2:])])
-    return False
-
-
-def parse_sex(tokens):
-    global cur_individual
-    """checks that 'SEX' was in proper format"""
-    if tokens[1] == "SEX" and len(tokens) == 3:
-        if tokens[2] == "M" or tokens[2] == "F":
-            cur_individual["GENDER"] = tokens[2]
-            # write_it(["<-- ", tokens[0], "|", tokens[1], "|Y|", tokens[2]])
-            return True
-        # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", tokens[2]])
-        return False
-    else:
-        # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", " ".join(str(e) for e in tokens[2:])])
+
+    # checks if tokens represent level one tag, parsing the arguments for correctness
+    def is_level_one_tag(self, tokens):
+        """Returns bool representing whether or not it is a valid level 1 tag"""
+        # if first token is not a digit or is not equal to one, it is a poorly formatted
+        # line and returns false
+        if not tokens[0].isdigit() or int(tokens[0]) != 1:
+            return False
+        # checks if 2nd token (index 1) is a valid tag, and then checks the corresponding arguments,
+        # updating last_level_1 appropriately
+        #
+        # if it is a valid tag, it updates the cur_individual or cur_family variables appropriately according to
+        # context indicated by the last_level_0 (a tag of the wrong kind of record is rejected)
+        record_tag, parse_method = self.level_1_parsers.get(tokens[1], (None, None))
+        if record_tag is None or self.last_level_0 != record_tag:
+            return False
+        ret_val = parse_method(tokens)
+        if ret_val:
+            self.last_level_1 = tokens[1]
+        return ret_val
+
+    # checks if tokens represent level two tag, parsing the arguments for correctness
+    def is_level_two_tag(self, tokens):
+        """Returns bool representing whether or not it is a valid level 2 tag"""
+        # if first token is not a digit or is not equal to two, it is a poorly formatted
+        # line and returns false
+        if not tokens[0].isdigit() or int(tokens[0]) != 2:
+            return False
+        # checks if 2nd token (index 1) is a valid tag, and then checks the corresponding arguments
+        #
+        # if it is a valid tag, it updates the cur_individual or cur_family variables appropriately according to
+        # context indicated by the last_level_1
+        if tokens[1] == "DATE" and self.last_level_1 in DATE_CONTEXTS:
+            return self.parse_date(tokens)
         return False
 
+    # checks if it is a new individual or family. If it is, stores the appropriate old individual or family and creates a new one
+    def parse_indi_fam(self, tokens):
+        """checks that 'INDI' or 'FAM' was in proper format"""
+        if len(tokens) == 3 and (tokens[2] == "INDI" or tokens[2] == "FAM"):
+            # write_it(["<-- ", tokens[0], "|", tokens[2], "|Y|", tokens[1]])
+            # the previous record has already been closed by parseRecords()
+            if tokens[2] == "INDI":
+                # print("Individual: %s" % (cur_individual))
+                self.cur_individual = {}
+                self.cur_individual["ID"] = tokens[1]
+                self.cur_individual["CHILD"] = None
+                self.cur_individual["SPOUSE"] = None
+            elif tokens[2] == "FAM":
+                # print("Family: %s" % (cur_family))
+                self.cur_family = {}
+                self.cur_family["ID"] = tokens[1]
+                self.cur_family["CHILDREN"] = set()
+            return True
+        # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", "".join(str(e) for e in tokens[2:])])
+        return False
 
-def parse_birt_deat_marr_div(tokens):
-    """checks that 'BIRT' or 'DEAT' or 'MARR' or 'DIV' was in proper format"""
-    if (tokens[1] == "BIRT" or tokens[1] == "DEAT" or tokens[1] == "MARR" or tokens[1] == "DIV") and len(tokens) == 2:
-        # write_it(["<-- ", tokens[0], "|", tokens[1], "|Y|"])
-        return True
-    # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", " ".join(str(e) for e in tokens[2:])])
-    return False
+    def parse_head_trlr(self, tokens):
+        """checks that 'HEAD' or 'TRLR' was in proper format"""
+        if (tokens[1] == "HEAD" or tokens[1] == "TRLR") and len(tokens) == 2:
+            # write_it(["<-- ", tokens[0], "|", tokens[1], "|Y|"])
+            return True
+        # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", "".join(str(e) for e in tokens[2:])])
+        return False
 
+    def parse_note(self, tokens):
+        """checks that 'NOTE' was in proper format"""
+        if tokens[1] == "NOTE":
+            # write_it(["<-- ", tokens[0], "|", tokens[1], "|Y|"])
+            return True
+        # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", "".join(str(e) for e in tokens[2:])])
+        return False
 
-def parse_name(tokens):
-    """checks that 'NAME' was in proper format"""
-    global cur_individual
-    if tokens[1] == "NAME" and len(tokens) > 3:
-        if tokens[len(tokens) - 1][0] == "/" and tokens[len(tokens) - 1][len(tokens[len(tokens) - 1]) - 1] == "/":
-            cur_individual["NAME"] = " ".join(tokens[2:])
-            # write_it(["<-- ", tokens[0], "|", tokens[1], "|Y|", " ".join(str(e) for e in tokens[2:])])
+    def parse_sex(self, tokens):
+        """checks that 'SEX' was in proper format"""
+        if tokens[1] == "SEX" and len(tokens) == 3:
+            if tokens[2] == "M" or tokens[2] == "F":
+                self.cur_individual["GENDER"] = tokens[2]
+                # write_it(["<-- ", tokens[0], "|", tokens[1], "|Y|", tokens[2]])
+                return True
+            # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", tokens[2]])
+            return False
+        else:
+            # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", " ".join(str(e) for e in tokens[2:])])
+            return False
+
+    def parse_birt_deat_marr_div(self, tokens):
+        """checks that 'BIRT' or 'DEAT' or 'MARR' or 'DIV' was in proper format"""
+        if (tokens[1] == "BIRT" or tokens[1] == "DEAT" or tokens[1] == "MARR" or tokens[1] == "DIV") and len(tokens) == 2:
+            # write_it(["<-- ", tokens[0], "|", tokens[1], "|Y|"])
             return True
         # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", " ".join(str(e) for e in tokens[2:])])
         return False
-    else:
+
+    def parse_name(self, tokens):
+        """checks that 'NAME' was in proper format"""
+        if tokens[1] == "NAME" and len(tokens) > 3:
+            if tokens[len(tokens) - 1][0] == "/" and tokens[len(tokens) - 1][len(tokens[len(tokens) - 1]) - 1] == "/":
+                self.cur_individual["NAME"] = " ".join(tokens[2:])
+                # write_it(["<-- ", tokens[0], "|", tokens[1], "|Y|", " ".join(str(e) for e in tokens[2:])])
+                return True
+            # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", " ".join(str(e) for e in tokens[2:])])
+            return False
+        else:
+            # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", " ".join(str(e) for e in tokens[2:])])
+            return False
+
+    def parse_famc_fams_husb_wife_chil(self, tokens):
+        """checks that 'FAMC' or 'FAMS' or 'HUSB' or 'WIFE' or 'CHIL' was in proper format"""
+        if (tokens[1] == "FAMC" or tokens[1] == "FAMS" or tokens[1] == "HUSB" or tokens[1] == "WIFE" or tokens[
+            1] == "CHIL") and len(tokens) == 3:
+            if tokens[1] == "FAMC":
+                self.cur_individual["CHILD"] = tokens[2]
+            elif tokens[1] == "FAMS":
+                if self.cur_individual["SPOUSE"] is None:
+                    self.cur_individual["SPOUSE"] = {tokens[2]}
+                else:
+                    self.cur_individual["SPOUSE"].add(tokens[2])
+            elif tokens[1] == "HUSB":
+                self.cur_family["HUSBAND ID"] = tokens[2]
+            elif tokens[1] == "WIFE":
+                self.cur_family["WIFE ID"] = tokens[2]
+            elif tokens[1] == "CHIL":
+                if "CHILD ID" in self.cur_family.keys():
+                    self.cur_family["CHILDREN"] = self.cur_family.get("CHILDREN").add(tokens[2])
+                else:
+                    self.cur_family["CHILDREN"] = {tokens[2]}
+            # write_it(["<-- ", tokens[0], "|", tokens[1], "|Y|", tokens[2]])
+            return True
         # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", " ".join(str(e) for e in tokens[2:])])
         return False
 
+    def parse_date(self, tokens):
+        """checks that 'DATE' was in proper format"""
+        months = {"JAN": True, "FEB": True, "MAR": True, "APR": True, "MAY": True, "JUN": True, "JUL": True, "AUG": True, "SEP": True, "OCT": True, "NOV": True, "DEC": True}
+
+        if tokens[1] == "DATE"  and date_is_legitimate(tokens[2:]):
+            if self.last_level_1 == "BIRT":
+                self.cur_individual["BIRTHDAY"] = " ".join(finish_date(tokens[2:]))
+                self.cur_individual["BIRTHDAY_PRECISION"] = date_precision(tokens[2:])
+            elif self.last_level_1 == "DEAT":
+                self.cur_individual["DEATH"] = " ".join(finish_date(tokens[2:]))
+                self.cur_individual["DEATH_PRECISION"] = date_precision(tokens[2:])
+            elif self.last_level_1 == "DIV":
+                self.cur_family["DIVORCED"] = " ".join(finish_date(tokens[2:]))
+                self.cur_family["DIVORCED_PRECISION"] = date_precision(tokens[2:])
+            elif self.last_level_1 == "MARR":
+                self.cur_family["MARRIED"] = " ".join(finish_date(tokens[2:]))
+                self.cur_family["MARRIED_PRECISION"] = date_precision(tokens[2:])
+            return True
+        else:
+            self.on_illegitimate_date(' '.join(tokens[2:]))
+            if self.last_level_1 == "BIRT":
+                self.cur_individual["BIRTHDAY"] = np.nan
+            elif self.last_level_1 == "DEAT":
+                self.cur_individual["DEATH"] = np.nan
+            elif self.last_level_1 == "DIV":
+                self.cur_family["DIVORCED"] = np.nan
+            elif self.last_level_1 == "MARR":
+                self.cur_family["MARRIED"] = np.nan
 
-def parse_famc_fams_husb_wife_chil(tokens):
-    """checks that 'FAMC' or 'FAMS' or 'HUSB' or 'WIFE' or 'CHIL' was in proper format"""
-    global cur_family
-    global cur_individual
-    if (tokens[1] == "FAMC" or tokens[1] == "FAMS" or tokens[1] == "HUSB" or tokens[1] == "WIFE" or tokens[
-        1] == "CHIL") and len(tokens) == 3:
-        if tokens[1] == "FAMC":
-            cur_individual["CHILD"] = tokens[2]
-        elif tokens[1] == "FAMS":
-            if cur_individual["SPOUSE"] is None:
-                cur_individual["SPOUSE"] = {tokens[2]}
-            else:
-                cur_individual["SPOUSE"].add(tokens[2])
-        elif tokens[1] == "HUSB":
-            cur_family["HUSBAND NAME"] = lookup_name(tokens[2])
-            cur_family["HUSBAND ID"] = tokens[2]
-        elif tokens[1] == "WIFE":
-            cur_family["WIFE NAME"] = lookup_name(tokens[2])
-            cur_family["WIFE ID"] = tokens[2]
-        elif tokens[1] == "CHIL":
-            if "CHILD ID" in cur_family.keys():
-                cur_family["CHILDREN"] = cur_family.get("CHILDREN").add(tokens[2])
-            else:
-                cur_family["CHILDREN"] = {tokens[2]}
-        # write_it(["<-- ", tokens[0], "|", tokens[1], "|Y|", tokens[2]])
-        return True
-    # write_it(["<-- ", tokens[0], "|", tokens[1], "|N|", " ".join(str(e) for e in tokens[2:])])
-    return False
-
-
-def parse_date(tokens):
-    """checks that 'DATE' was in proper format"""
-    months = {"JAN": True, "FEB": True, "MAR": True, "APR": True, "MAY": True, "JUN": True, "JUL": True, "AUG": True, "SEP": True, "OCT": True, "NOV": True, "DEC": True}
-
-    if tokens[1] == "DATE"  and date_is_legitimate(tokens[2:]):
-        if last_level_1 == "BIRT":
-            cur_individual["BIRTHDAY"] = " ".join(finish_date(tokens[2:]))
-        elif last_level_1 == "DEAT":
-            cur_individual["DEATH"] = " ".join(finish_date(tokens[2:]))
-        elif last_level_1 == "DIV":
-            cur_family["DIVORCED"] = " ".join(finish_date(tokens[2:]))
-        elif last_level_1 == "MARR":
-            cur_family["MARRIED"] = " ".join(finish_date(tokens[2:]))
-        return True
-    else:
-        print("ERROR: PARSER: US42: DATE '{}' is illegitimate".format(' '.join(tokens[2:])))
-        if last_level_1 == "BIRT":
-            cur_individual["BIRTHDAY"] = np.nan
-        elif last_level_1 == "DEAT":
-            cur_individual["DEATH"] = np.nan
-        elif last_level_1 == "DIV":
-            cur_family["DIVORCED"] = np.nan
-        elif last_level_1 == "MARR":
-            cur_family["MARRIED"] = np.nan
-
-    return False
-
+        return False
 
-def lookup_name(pid):
-    """
-    looks up name of husband in current and past individuals
-    """
-    global cur_individual
-    global individual_list
-    if pid in cur_individual.values():
-        return cur_individual.get("NAME")
-    for x in individual_list:
-        if pid in x.values():
-            return x.get("NAME")
-    return "NULL_NAME"
+    def lookup_name(self, pid):
+        """
+        looks up name of husband or wife in the collected individuals
+        """
+        individual = self.individuals_by_id.get(pid)
+        if individual is None:
+            return "NULL_NAME"
+        return individual.get("NAME")
 
 
 def date_is_legitimate(supposed_date):
@@ -408,3 +463,13 @@ def finish_date(old_date):
         return ['1', old_date[0], old_date[1]]
     else:
         return old_date
+
+
+def date_precision(old_date):
+    """returns how precise a (possibly incomplete) date is: 'DAY', 'MONTH' or 'YEAR'"""
+    if len(old_date) == 1:
+        return "YEAR"
+    elif len(old_date) == 2:
+        return "MONTH"
+    else:
+        return "DAY"
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import List, NamedTuple, Optional
+
+import pandas as pd
+
+# Bump whenever the parser or the data-frames it builds change, so that entries of older versions are never read
+PARSER_VERSION = 3
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+SUFFIX = '.pkl'
+
+
+class ParsedFile(NamedTuple):
+    """What parsing one file produces before the ages are computed (they depend on the reference date)"""
+    indivs_df: pd.DataFrame
+    families_df: pd.DataFrame
+    # Dates rejected by US42 while parsing, reported again when the file is read from the cache
+    illegitimate_dates: List[str]
+
+
+class ParseCache:
+    """
+    Directory of pickled ParsedFiles, keyed by the SHA-256 of the file content, the parser version and the pandas
+    version. Pickle is used because the SPOUSE and CHILDREN cells hold python sets, which Parquet and Feather can not
+    store. When the directory grows beyond max_bytes the least recently used entries are deleted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, filename: str) -> str:
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                digest.update(chunk)
+        return "{}-v{}-pandas{}".format(digest.hexdigest(), PARSER_VERSION, pd.__version__)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key: str) -> Optional[ParsedFile]:
+        """:return: the cached entry or None if there is none (or it can not be read)"""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                parsed = pickle.load(f)
+            # Mark as recently used for the eviction
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return parsed
+
+    def put(self, key: str, parsed: ParsedFile):
+        # Write to a temporary file first, so that concurrent runs never read a half written entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path(key))
+        self.evict(keep=self.path(key))
+
+    def evict(self, keep: str = None):
+        """Delete the least recently used entries (except keep) until the cache is no larger than max_bytes"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# Incremental re-validation: a state file keeps the hash of every INDI / FAM record, which individuals belong to which
+# family and the findings of every rule of the last run. The next run only re-runs the rules with an anchor (see
+# registry.Rule.anchor) on the records that changed, their families and the members of those families, and reuses
+# the findings of all other records. Rules without an anchor, rules that were not run last time and all rules on a
+# new day (stories compare dates with today) are run on the whole tree.
+#
+# The file is still parsed and all records are hashed on every run; what no longer depends on the size of the tree is
+# the work of the rules.
+
+import hashlib
+import itertools
+import os
+import pickle
+import tempfile
+from datetime import date
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import pandas as pd
+
+from context import ValidationContext
+from registry import Rule
+from report import Anomaly
+
+# Bump whenever the content of IncrementalState changes, so that state files of older versions are not used
+STATE_VERSION = 1
+
+RuleKey = Tuple[str, str]
+
+
+class IncrementalState(NamedTuple):
+    version: int
+    # Day of the run, as ISO date
+    today: str
+    # Hash of the records by id
+    hashes: Dict[str, str]
+    # Ids of the individuals of every family
+    members: Dict[str, Set[str]]
+    # Anomalies of every rule with an anchor, by rule_key
+    findings: Dict[RuleKey, List[Anomaly]]
+
+
+def rule_key(r: Rule) -> RuleKey:
+    return r.story_id, r.template
+
+
+def stable_repr(value) -> str:
+    """repr that does not depend on the iteration order of sets (which differs between python processes)"""
+    if isinstance(value, (set, frozenset)):
+        return "{" + ", ".join(sorted(stable_repr(v) for v in value)) + "}"
+    return repr(value)
+
+
+def record_hashes(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> Dict[str, str]:
+    """:return: hash of every record (of all records with that id, if ids are not unique) by id"""
+    hashes: Dict[str, str] = {}
+    for df in (indivs_df, families_df):
+        for record_id, row in zip(df['ID'], df.itertuples(index=False)):
+            digest = hashlib.sha1(stable_repr(tuple(row)).encode()).hexdigest()
+            hashes[record_id] = hashlib.sha1((hashes[record_id] + digest).encode()).hexdigest() \
+                if record_id in hashes else digest
+    return hashes
+
+
+def family_members(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> Dict[str, Set[str]]:
+    """:return: ids of husband, wife and children of every family, from the families and from the individuals"""
+    members: Dict[str, Set[str]] = {}
+    for fam_id, husband, wife, children in zip(families_df['ID'], families_df['HUSBAND ID'], families_df['WIFE ID'],
+                                               families_df['CHILDREN']):
+        family = members.setdefault(fam_id, set())
+        family.update(spouse for spouse in (husband, wife) if isinstance(spouse, str))
+        if isinstance(children, (set, frozenset)):
+            family.update(children)
+    for indiv_id, child, spouse in zip(indivs_df['ID'], indivs_df['CHILD'], indivs_df['SPOUSE']):
+        if isinstance(child, str):
+            members.setdefault(child, set()).add(indiv_id)
+        if isinstance(spouse, (set, frozenset)):
+            for fam_id in spouse:
+                members.setdefault(fam_id, set()).add(indiv_id)
+    return members
+
+
+def families_of(members: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+    """:return: ids of the families of every individual"""
+    families: Dict[str, Set[str]] = {}
+    for fam_id, family in members.items():
+        for indiv_id in family:
+            families.setdefault(indiv_id, set()).add(fam_id)
+    return families
+
+
+def affected_records(changed: Set[str], members: Dict[str, Set[str]], old_members: Dict[str, Set[str]]) \
+        -> Tuple[Set[str], Set[str]]:
+    """
+    :param changed: ids of the records that were added, removed or changed
+    :param members: family_members() of this run
+    :param old_members: family_members() of the last run (families an individual was removed from are affected too)
+    :return: anchors: ids of the records whose findings may have changed (changed records, the families of changed
+             individuals, the members of those and of changed families),
+             scope: ids of the records the rules need to find them (anchors, their families and the members of those)
+    """
+    new_families, old_families = families_of(members), families_of(old_members)
+    dirty_families = {c for c in changed if c in members or c in old_members}
+    for c in changed:
+        dirty_families |= new_families.get(c, set()) | old_families.get(c, set())
+    anchors = changed | dirty_families
+    for fam_id in dirty_families:
+        anchors |= members.get(fam_id, set()) | old_members.get(fam_id, set())
+    scope_families = set(dirty_families)
+    for anchor in anchors:
+        scope_families |= new_families.get(anchor, set())
+    scope = anchors | scope_families
+    for fam_id in scope_families:
+        scope |= members.get(fam_id, set())
+    return anchors, scope
+
+
+def load_state(state_file: str) -> Optional[IncrementalState]:
+    """:return: the state of the last run, None if there is none (or it is of an older version)"""
+    try:
+        with open(state_file, 'rb') as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    return state if isinstance(state, IncrementalState) and state.version == STATE_VERSION else None
+
+
+def save_state(state_file: str, state: IncrementalState):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(state_file)), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, state_file)
+
+
+def run_incremental(ctx: ValidationContext, selected: List[Rule], state_file: str,
+                    run: Callable[[ValidationContext, List[Rule]], Iterable[List[Anomaly]]]) -> List[List[Anomaly]]:
+    """
+    Run rules on one file, reusing the findings of the last run stored in state_file for the records that did not
+    change, and store the findings of this run.
+    The anomalies of a rule with an anchor are ordered by the position of the anchor record in the file, so they are
+    the same no matter which of them were reused.
+    :param ctx: context of the file
+    :param selected: rules to run
+    :param state_file: file holding the state of the last run (created if it does not exist)
+    :param run: function running rules on a context, yielding the anomalies of every rule (see validate.run_checks)
+    :return: the anomalies found by every rule, in the order of selected
+    """
+    indivs_df, families_df = ctx.indivs_df, ctx.families_df
+    state = load_state(state_file)
+    today = date.today().isoformat()
+    hashes = record_hashes(indivs_df, families_df)
+    members = family_members(indivs_df, families_df)
+
+    reuse = state is not None and state.today == today
+    incremental = [r for r in selected if reuse and r.anchor is not None and rule_key(r) in state.findings]
+    incremental_keys = {rule_key(r) for r in incremental}
+    full = [r for r in selected if rule_key(r) not in incremental_keys]
+
+    results: Dict[RuleKey, List[Anomaly]] = {}
+    for r, anomalies in zip(full, run(ctx, full)):
+        results[rule_key(r)] = anomalies
+    if incremental:
+        changed = {i for i in hashes.keys() | state.hashes.keys() if hashes.get(i) != state.hashes.get(i)}
+        anchors, scope = affected_records(changed, members, state.members)
+        sub_ctx = ValidationContext(indivs_df[indivs_df['ID'].isin(scope)], families_df[families_df['ID'].isin(scope)])
+        found = run(sub_ctx, incremental) if anchors else ([] for _ in incremental)
+        for r, anomalies in zip(incremental, found):
+            results[rule_key(r)] = [a for a in state.findings[rule_key(r)] if a.fields[r.anchor] not in anchors] \
+                + [a for a in anomalies if a.fields[r.anchor] in anchors]
+
+    # position of the first record with an id in the file (individuals before families)
+    position: Dict[str, int] = {}
+    for record_id in itertools.chain(indivs_df['ID'], families_df['ID']):
+        position.setdefault(record_id, len(position))
+    for r in selected:
+        if r.anchor is not None:
+            results[rule_key(r)].sort(key=lambda a: position.get(a.fields[r.anchor], len(position) + 1))
+
+    save_state(state_file, IncrementalState(STATE_VERSION, today, hashes, members,
+                                            {rule_key(r): results[rule_key(r)] for r in selected
+                                             if r.anchor is not None}))
+    return [results[rule_key(r)] for r in selected]
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional
+
+import pandas as pd
+from tabulate import tabulate
+
+# the CPU time of the current thread needs python 3.7, older versions measure the whole process
+thread_time = getattr(time, 'thread_time', time.process_time)
+
+
+class StageProfile:
+    """Measurements of one stage (e.g. parsing or one user story) of a validation run"""
+
+    def __init__(self, name: str, rows_in: Optional[int] = None):
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rows_in = rows_in
+        self.rows_out: Optional[int] = None
+        self.peak_mb: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'stage': self.name, 'wall_s': self.wall, 'cpu_s': self.cpu, 'rows_in': self.rows_in,
+                'rows_out': self.rows_out, 'peak_mb': self.peak_mb}
+
+
+class Profiler:
+    """
+    Collects a StageProfile for every stage run inside stage().
+    CPU time is the time of the thread running the stage, so it stays meaningful with --jobs (on python 3.7 and
+    newer). Peak memory is traced with tracemalloc (which slows down pure python code) and is only exact when stages
+    do not run concurrently.
+    """
+
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.stages: List[StageProfile] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None) -> Iterator[StageProfile]:
+        """
+        Measure the code run in the with-block. Set rows_out on the yielded profile to record the output rows.
+        """
+        profile = StageProfile(name, rows_in)
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if hasattr(tracemalloc, 'reset_peak'):
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            else:
+                # python < 3.9 can only reset the peak by forgetting all traced memory
+                tracemalloc.clear_traces()
+                before = 0
+        wall, cpu = time.perf_counter(), thread_time()
+        try:
+            yield profile
+        finally:
+            profile.wall = time.perf_counter() - wall
+            profile.cpu = thread_time() - cpu
+            if self.memory:
+                profile.peak_mb = max(0, tracemalloc.get_traced_memory()[1] - before) / 2 ** 20
+            with self._lock:
+                self.stages.append(profile)
+
+    def stop(self):
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def summary(self) -> pd.DataFrame:
+        """
+        :return: one row per stage name (stages run several times, e.g. user stories with several rules, are summed up,
+                 their peak memory is the maximum), sorted by decreasing wall time. Unknown row counts and memory are
+                 NaN.
+        """
+        df = pd.DataFrame([p.to_dict() for p in self.stages],
+                          columns=['stage', 'wall_s', 'cpu_s', 'rows_in', 'rows_out', 'peak_mb'])
+        df = df.astype({'rows_in': float, 'rows_out': float, 'peak_mb': float})
+        df = df.groupby('stage', sort=False).agg({'wall_s': 'sum', 'cpu_s': 'sum', 'rows_in': 'max',
+                                                  'rows_out': lambda rows: rows.sum(min_count=1), 'peak_mb': 'max'})
+        return df.sort_values('wall_s', ascending=False)
+
+    def table(self) -> str:
+        return tabulate(self._with_row_counts(self.summary()), headers='keys', tablefmt='psql', floatfmt='.4f')
+
+    def to_json(self) -> str:
+        records = [{column: None if pd.isna(value) else value.item() if hasattr(value, 'item') else value
+                    for column, value in row.items()}
+                   for row in self._with_row_counts(self.summary().reset_index()).to_dict('records')]
+        return json.dumps(records, indent=2)
+
+    @staticmethod
+    def _with_row_counts(summary: pd.DataFrame) -> pd.DataFrame:
+        """:return: summary with the row counts as ints (None if unknown) instead of floats"""
+        for column in ['rows_in', 'rows_out']:
+            summary[column] = pd.Series([None if pd.isna(rows) else int(rows) for rows in summary[column]],
+                                        index=summary.index, dtype=object)
+        return summary
+
+
+@contextmanager
+def _unprofiled(name: str, rows_in: Optional[int] = None) -> Iterator[SimpleNamespace]:
+    yield SimpleNamespace()
+
+
+def stage_of(profiler: Optional[Profiler]) -> Callable[..., ContextManager]:
+    """:return: profiler.stage, or a stage measuring nothing if profiler is None"""
+    return _unprofiled if profiler is None else profiler.stage
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+from typing import Callable, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+
+import pandas as pd
+
+from context import ValidationContext
+from report import Anomaly
+
+ERROR = "ERROR"
+NOTICE = "NOTICE"
+
+# What a rule finds: a data-frame holding (at least) the rule's columns, or a list of tuples of the column values
+Findings = Union[pd.DataFrame, Iterable[Sequence]]
+
+
+class Rule(NamedTuple):
+    """
+    One kind of message of a user story.
+    A user story that prints several kinds of messages (e.g. US01 for births, deaths, marriages and divorces) registers
+    one rule per kind under the same story_id.
+    """
+    story_id: str
+    severity: str
+    entity: str
+    # Message after the "<severity>: <entity>: <story_id>: " prefix, formatted with the values of columns
+    template: str
+    columns: Tuple[str, ...]
+    # Derived tables of ValidationContext the rule needs (names of its memoized methods)
+    tables: Tuple[str, ...]
+    # Column holding the id of the individual or family a finding is about, if a finding only depends on that record and
+    # its immediate relatives (see incremental.py). None if it may depend on records anywhere in the tree.
+    anchor: Optional[str]
+    find: Callable[[ValidationContext], Findings]
+
+    def anomalies(self, ctx: ValidationContext) -> List[Anomaly]:
+        """
+        Run the rule on one file.
+        :param ctx: context of the file
+        :return: one anomaly per finding
+        """
+        return [Anomaly(self.story_id, self.severity, self.entity, self.template.format(*values),
+                        dict(zip(self.columns, values)))
+                for values in self.rows(ctx)]
+
+    def messages(self, ctx: ValidationContext) -> List[str]:
+        """
+        :param ctx: context of the file
+        :return: the printed message of every anomaly the rule finds
+        """
+        return [a.text for a in self.anomalies(ctx)]
+
+    def rows(self, ctx: ValidationContext) -> List[Tuple]:
+        """
+        :param ctx: context of the file
+        :return: the values of columns for every finding
+        """
+        findings = self.find(ctx)
+        if isinstance(findings, pd.DataFrame):
+            if findings.empty:
+                return []
+            return list(zip(*(findings[c] for c in self.columns)))
+        return [tuple(f) for f in findings]
+
+
+# All registered rules in the order their messages are printed
+rules: List[Rule] = []
+
+
+def rule(story_id: str, severity: str, entity: str, template: str, columns: Sequence[str],
+         tables: Sequence[str] = (), anchor: Optional[str] = None):
+    """
+    Decorator registering a function ctx -> findings as a rule.
+    :param story_id: id of the user story, e.g. US01
+    :param severity: ERROR or NOTICE
+    :param entity: what the message is about, e.g. INDIVIDUAL
+    :param template: message template, formatted with the values of columns
+    :param columns: columns of the findings that are put into the message
+    :param tables: derived tables of ValidationContext the function uses
+    :param anchor: column with the id of the individual or family a finding is about (see Rule.anchor)
+    """
+    def register(find: Callable[[ValidationContext], Findings]):
+        new = Rule(story_id, severity, entity, template, tuple(columns), tuple(tables), anchor, find)
+        # Registering a rule again (e.g. when validate.py is imported as validate and as gedcomValidator.validate)
+        # replaces it instead of printing its messages twice
+        for i, r in enumerate(rules):
+            if r[:-1] == new[:-1]:
+                rules[i] = new
+                return find
+        rules.append(new)
+        return find
+    return register
+
+
+def story_ids() -> List[str]:
+    """:return: ids of all registered user stories, in registration order"""
+    return list(dict.fromkeys(r.story_id for r in rules))
+
+
+def select_rules(only: Optional[Iterable[str]] = None, skip: Optional[Iterable[str]] = None) -> List[Rule]:
+    """
+    :param only: ids of the user stories to run (all if None)
+    :param skip: ids of the user stories not to run
+    :return: the selected rules, in registration order
+    """
+    return [r for r in rules if is_selected(r.story_id, only, skip)]
+
+
+def is_selected(story_id: str, only: Optional[Iterable[str]] = None, skip: Optional[Iterable[str]] = None) -> bool:
+    return (only is None or story_id in only) and (skip is None or story_id not in skip)
+
+
+def required_tables(selected: Iterable[Rule]) -> List[str]:
+    """:return: names of the derived tables the rules need, each once"""
+    return list(dict.fromkeys(t for r in selected for t in r.tables))
+
+
+def parse_story_ids(text: str) -> Set[str]:
+    """
+    Parse a comma separated list of user story ids like "US01,us2, US13"
+    :return: normalized ids, e.g. {'US01', 'US02', 'US13'}
+    """
+    ids = set()
+    for story_id in text.split(","):
+        story_id = story_id.strip().upper()
+        if story_id:
+            number = story_id[2:] if story_id.startswith("US") else story_id
+            ids.add("US" + number.zfill(2))
+    return ids
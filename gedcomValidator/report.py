@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import csv
+import json
+from typing import Any, Dict, Iterable, NamedTuple, TextIO
+
+import numpy as np
+import pandas as pd
+
+
+class Anomaly(NamedTuple):
+    """One finding of a user story"""
+    story_id: str
+    severity: str
+    entity: str
+    # Message without the "<severity>: <entity>: <story_id>: " prefix
+    message: str
+    # Values the message was formatted with (entity ids, dates, ...) by column name
+    fields: Dict[str, Any]
+
+    @property
+    def text(self) -> str:
+        """The message as printed by the validator"""
+        return "{}: {}: {}: {}".format(self.severity, self.entity, self.story_id, self.message)
+
+    def to_record(self) -> Dict[str, Any]:
+        """:return: the anomaly as a JSON serializable dict"""
+        return {'story': self.story_id, 'severity': self.severity, 'entity': self.entity, 'message': self.message,
+                'fields': {column: to_json_value(value) for column, value in self.fields.items()}}
+
+
+def to_json_value(value: Any) -> Any:
+    """Convert a value of a data-frame cell to something json can serialize: sets become sorted lists, NaN None"""
+    if isinstance(value, (set, frozenset, list, tuple)):
+        return sorted((to_json_value(v) for v in value), key=str)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).strftime('%Y-%m-%d')
+    return str(value)
+
+
+class TextWriter:
+    """Writes anomalies as the messages the validator always printed, one per line"""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+
+    def write(self, anomalies: Iterable[Anomaly]):
+        # One write per batch instead of one print per anomaly
+        self.stream.write("".join(a.text + "\n" for a in anomalies))
+
+
+class JsonlWriter(TextWriter):
+    """Writes anomalies as JSON Lines, one object per anomaly (see Anomaly.to_record)"""
+
+    def write(self, anomalies: Iterable[Anomaly]):
+        self.stream.write("".join(json.dumps(a.to_record()) + "\n" for a in anomalies))
+
+
+class CsvWriter(TextWriter):
+    """Writes anomalies as CSV with a header line, fields is a JSON object"""
+
+    columns = ['story', 'severity', 'entity', 'message', 'fields']
+
+    def __init__(self, stream: TextIO):
+        super().__init__(stream)
+        self.csv = csv.writer(stream, lineterminator="\n")
+        self.csv.writerow(self.columns)
+
+    def write(self, anomalies: Iterable[Anomaly]):
+        records = [a.to_record() for a in anomalies]
+        self.csv.writerows([r[c] if c != 'fields' else json.dumps(r[c]) for c in self.columns] for r in records)
+
+
+writers = {'text': TextWriter, 'jsonl': JsonlWriter, 'csv': CsvWriter}
@@ -12,60 +12,62 @@ import numpy as np
 from typing import Tuple
 from datetime import date
 from utils import *
+from gedcomParser.fileToDataframes import day_number
+from context import ValidationContext, IndivsOrContext
 
 
 # US 01 - Dates before current date
-def dates_before_current_date(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+def dates_before_current_date(indivs_df: IndivsOrContext, families_df: pd.DataFrame = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     Detect all dates in file that are after current date
     :param indivs_df:
     :param families_df:
     :return:
     """
+    ctx = ValidationContext.of(indivs_df, families_df)
+    indivs_df, families_df = ctx.indivs_df, ctx.families_df
 
     # extract rows with bad dates from individuals
-    inds_birthday_no_null = indivs_df[indivs_df.BIRTHDAY.notnull()]
-    inds_birthday_violations = inds_birthday_no_null[inds_birthday_no_null.BIRTHDAY.apply(parse_date) > datetime.datetime.now()]
-    inds_death_no_null = indivs_df[indivs_df.DEATH.notnull()]
-    inds_death_violations = inds_death_no_null[inds_death_no_null.DEATH.apply(parse_date) > datetime.datetime.now()]
+    now = day_number(datetime.datetime.now())
+    inds_birthday_violations = indivs_df[indivs_df.BIRTHDAY_DT > now]
+    inds_death_violations = indivs_df[indivs_df.DEATH_DT > now]
 
     # extract rows with bad dates from families
-    fams_marriage_no_null = families_df[families_df.MARRIED.notnull()]
-    fams_marriage_violations = fams_marriage_no_null[fams_marriage_no_null.MARRIED.apply(parse_date) > datetime.datetime.now()]
-    fams_divorce_no_null = families_df[families_df.DIVORCED.notnull()]
-    fams_divorce_violations = fams_divorce_no_null[fams_divorce_no_null.DIVORCED.apply(parse_date) > datetime.datetime.now()]
+    fams_marriage_violations = families_df[families_df.MARRIED_DT > now]
+    fams_divorce_violations = families_df[families_df.DIVORCED_DT > now]
 
     return (inds_birthday_violations, inds_death_violations, fams_marriage_violations, fams_divorce_violations)
 
 
 # US 02 - Birth before marriage
-def birth_before_marriage(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> pd.DataFrame:
+def birth_before_marriage(indivs_df: IndivsOrContext, families_df: pd.DataFrame = None) -> pd.DataFrame:
     """
     Detect all Birth dates which are before marriage
     :param indivs_df: Individual data frame
     :param families_df: Family data frame
     :return: All indivis which Birth date is before marriage
     """
-    merged_data = join_by_spouse(indivs_df, families_df)
+    merged_data = ValidationContext.of(indivs_df, families_df).join_by_spouse()
     all_married = merged_data[~merged_data['MARRIED'].isna() & ~merged_data['BIRTHDAY'].isna()]
-    res = all_married[all_married['MARRIED'].apply(parse_date) < all_married['BIRTHDAY'].apply(parse_date)]
+    res = all_married[all_married['MARRIED_DT'] < all_married['BIRTHDAY_DT']]
     return res
 
 
 # US 03 - Birth before death
-def birth_before_death(indivs_df: pd.DataFrame) -> pd.DataFrame:
+def birth_before_death(indivs_df: IndivsOrContext) -> pd.DataFrame:
     """
     Detect all Birth dates which are before death
     :param indivs_df: Individual data frame
     :return: All indivis which Birth date is before death
     """
+    indivs_df = ValidationContext.of(indivs_df).indivs_df
     indivs = indivs_df[~indivs_df['BIRTHDAY'].isna() & ~indivs_df['DEATH'].isna()]
-    res = indivs[indivs['BIRTHDAY'].apply(parse_date) > indivs['DEATH'].apply(parse_date)]
+    res = indivs[indivs['BIRTHDAY_DT'] > indivs['DEATH_DT']]
     return res
 
 
 # US 04
-def marriage_before_divorce(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> pd.DataFrame:
+def marriage_before_divorce(indivs_df: IndivsOrContext, families_df: pd.DataFrame = None) -> pd.DataFrame:
     """
     Detects all individuals where their marriage occured after divorce.
     divorce is before the marriage.
@@ -73,65 +75,65 @@ def marriage_before_divorce(indivs_df: pd.DataFrame, families_df: pd.DataFrame)
     :param famalies_df:
     :return:
     """
-    indiv_fams: pd.DataFrame = join_by_spouse(indivs_df, families_df)
+    indiv_fams: pd.DataFrame = ValidationContext.of(indivs_df, families_df).join_by_spouse()
     # Only consider married, divorced individuals ...
     indiv_fams = indiv_fams[~indiv_fams['MARRIED'].isna() & ~indiv_fams['DIVORCED'].isna()]
     # ... who got married after the divorce
-    return indiv_fams[
-        indiv_fams['MARRIED'].apply(parse_date) > indiv_fams['DIVORCED'].apply(parse_date)]
+    return indiv_fams[indiv_fams['MARRIED_DT'] > indiv_fams['DIVORCED_DT']]
 
 
 # US 05
-def marriage_before_death(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> pd.DataFrame:
+def marriage_before_death(indivs_df: IndivsOrContext, families_df: pd.DataFrame = None) -> pd.DataFrame:
     """
     Detects all individuals that were married after their death
     :param indivs_df:
     :param families_df:
     :return:
     """
-    indiv_fams: pd.DataFrame = join_by_spouse(indivs_df, families_df)
+    indiv_fams: pd.DataFrame = ValidationContext.of(indivs_df, families_df).join_by_spouse()
     # Only consider married, death individuals ...
     indiv_fams = indiv_fams[~indiv_fams['MARRIED'].isna() & ~indiv_fams['DEATH'].isna()]
     # ... who got married after the death
-    return indiv_fams[
-        indiv_fams['MARRIED'].apply(parse_date) > indiv_fams['DEATH'].apply(parse_date)]
+    return indiv_fams[indiv_fams['MARRIED_DT'] > indiv_fams['DEATH_DT']]
 
 
 # US 06
-def divorce_before_death(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> pd.DataFrame:
+def divorce_before_death(indivs_df: IndivsOrContext, families_df: pd.DataFrame = None) -> pd.DataFrame:
     """
     Detect all individuals who got divorced after their death.
     :param indivs_df:
     :param families_df:
     :return:
     """
-    indiv_fams: pd.DataFrame = join_by_spouse(indivs_df, families_df)
+    indiv_fams: pd.DataFrame = ValidationContext.of(indivs_df, families_df).join_by_spouse()
     # Only consider dead, divorced individuals ...
     indiv_fams = indiv_fams[~indiv_fams['DEATH'].isna() & ~indiv_fams['DIVORCED'].isna()]
     # ... who got divorced after their death
-    return indiv_fams[indiv_fams['DEATH'].apply(parse_date) < indiv_fams['DIVORCED'].apply(parse_date)]
+    return indiv_fams[indiv_fams['DEATH_DT'] < indiv_fams['DIVORCED_DT']]
 
 
 # US 07
-def less_than_150_years_old(indivs_df: pd.DataFrame) -> pd.DataFrame:
+def less_than_150_years_old(indivs_df: IndivsOrContext) -> pd.DataFrame:
     """
     Detect all individuals who are older than 150 years.
     :param indivs_df:
     :return:
     """
+    indivs_df = ValidationContext.of(indivs_df).indivs_df
     return indivs_df[indivs_df['AGE'] > 150]
 
 
 # US 08 - Birth before marriage of parents
-def birth_before_parents_married(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> pd.DataFrame:
+def birth_before_parents_married(indivs_df: IndivsOrContext, families_df: pd.DataFrame = None) -> pd.DataFrame:
     """
     Detect all individuals who are born after their parents marriage
     :param indivs_df:
     :param families_df:
     :return:
     """
-    inds = indivs_df[indivs_df.BIRTHDAY.notnull()]
-    fams = families_df[families_df.MARRIED.notnull()]
+    ctx = ValidationContext.of(indivs_df, families_df)
+    inds = ctx.indivs_df[ctx.indivs_df.BIRTHDAY.notnull()]
+    fams = ctx.families_df[ctx.families_df.MARRIED.notnull()]
     joined = join_by_child(inds, fams)
 
     if joined.empty:
@@ -139,6 +141,6 @@ def birth_before_parents_married(indivs_df: pd.DataFrame, families_df: pd.DataFr
     joined = joined[joined.BIRTHDAY.notnull() & joined.MARRIED.notnull()]
     if joined.empty:
         return joined
-    joined = joined[joined.BIRTHDAY.apply(parse_date) < joined.MARRIED.apply(parse_date)]
+    joined = joined[joined.BIRTHDAY_DT < joined.MARRIED_DT]
     return joined
 
@@ -11,14 +11,18 @@ import numpy as np
 from typing import Tuple
 from datetime import date
 from utils import *
+from gedcomParser.fileToDataframes import day_number
+from context import ValidationContext, IndivsOrContext
 
 # US 22
-def unique_ids(indivs_df: pd.DataFrame, fams_df: pd.DataFrame) -> pd.DataFrame:
+def unique_ids(indivs_df: IndivsOrContext, fams_df: pd.DataFrame = None) -> pd.DataFrame:
     """
     Detect all individuals/families where the ID is duplicated
     :param indivs_df:
     :return:
     """
+    ctx = ValidationContext.of(indivs_df, fams_df)
+    indivs_df, fams_df = ctx.indivs_df, ctx.families_df
     indivs_duplicate = indivs_df[indivs_df.duplicated(['ID'])]
     fams_duplicate = fams_df[fams_df.duplicated(['ID'])]
     result = pd.concat([indivs_duplicate[["ID"]], fams_duplicate[["ID"]]])
@@ -26,76 +30,88 @@ def unique_ids(indivs_df: pd.DataFrame, fams_df: pd.DataFrame) -> pd.DataFrame:
 
 
 # US 25
-def unique_first_names_in_families(indivs_df: pd.DataFrame, fam_df: pd.DataFrame) -> pd.DataFrame:
+def unique_first_names_in_families(indivs_df: IndivsOrContext, fam_df: pd.DataFrame = None) -> pd.DataFrame:
     """
     Detect all individuals where the first name and the birth date is the same inside of a family.
     :param indivs_df:
     :return:
     """
-    children_with_fam = join_by_child(indivs_df, fam_df)
+    children_with_fam = ValidationContext.of(indivs_df, fam_df).join_by_child()
     if not children_with_fam.empty:
         return children_with_fam[children_with_fam.duplicated(['NAME', 'BIRTHDAY', 'ID_fam'])]
     else:
         return children_with_fam
 
 # US 28
-def order_siblings_by_age(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> pd.DataFrame:
+def order_siblings_by_age(indivs_df: IndivsOrContext, families_df: pd.DataFrame = None) -> pd.DataFrame:
     """
     Return families_df with siblings-list ordered by decreasing age
     :param indivs_df:
     :param families_df:
     :return:
     """
-    new_children = []
-    for cs in families_df['CHILDREN']:
-        child_age = [(c, indivs_df[indivs_df['ID'] == c].reset_index()['AGE_in_days'][0]) for c in cs]
-        child_age = [(c, a) for c, a in child_age if pd.isna(a)]\
-                    + sorted([(c, a) for c, a in child_age if not pd.isna(a)], key=lambda ca: ca[1], reverse=True)
-        new_children.append([(c, "no birthday" if pd.isna(a) else str(a)+" days old") for c, a in child_age])
+    ctx = ValidationContext.of(indivs_df, families_df)
+    indivs_df, families_df = ctx.indivs_df, ctx.families_df
+    edges = child_edges(families_df)
+    # Age of every child link, from the first individual with the child's id (NaN if there is none)
+    first = ~indivs_df['ID'].duplicated().values
+    positions = pd.Index(indivs_df['ID'].values[first]).get_indexer(edges['CHILD_ID'].values)
+    ages = indivs_df['AGE_in_days'].values[first].astype(object)
+    child_age = np.where(positions >= 0, ages[positions] if len(ages) else np.nan, np.nan)
+    unknown = pd.isna(child_age)
+    # Per family: children without birthday first, then by decreasing age (stable, ties stay in the order of the set)
+    order = np.lexsort((np.arange(len(edges)), -np.where(unknown, 0, child_age).astype(float), ~unknown,
+                        edges['FAM_POS'].values))
+    children = list(zip(edges['CHILD_ID'].values[order],
+                        ["no birthday" if u else str(a) + " days old" for a, u in zip(child_age[order], unknown[order])]))
+    offsets = np.searchsorted(edges['FAM_POS'].values[order], np.arange(len(families_df) + 1))
+    new_children = [children[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
     fams_df_copy = families_df.copy()
     fams_df_copy['CHILDREN'] = new_children
     return fams_df_copy
 
 
 # US 29
-def list_deceased(indivs_df: pd.DataFrame) -> pd.DataFrame:
+def list_deceased(indivs_df: IndivsOrContext) -> pd.DataFrame:
     """
     List all deceased individuals
     :param indivs_df:
     :return:
     """
-    indivs = indivs_df[indivs_df.DEATH.notnull()]
-    indivs = indivs[indivs.DEATH.apply(parse_date) <= datetime.datetime.now()]
-    return indivs
+    indivs_df = ValidationContext.of(indivs_df).indivs_df
+    return indivs_df[indivs_df.DEATH_DT <= day_number(datetime.datetime.now())]
 
 # US 31
-def list_living_single_older_than_30(indivs_df: pd.DataFrame) -> pd.DataFrame:
+def list_living_single_older_than_30(indivs_df: IndivsOrContext) -> pd.DataFrame:
     """
     Detect all individuals who are over the age of 30 and have never been married
     :param indivs_df:
     :return:
     """
+    indivs_df = ValidationContext.of(indivs_df).indivs_df
     indivs = indivs_df[indivs_df.AGE.notnull()]
     indivs = indivs[indivs.SPOUSE.isnull() & indivs.DEATH.isnull()]
     indivs = indivs[indivs.AGE > 30]
     return indivs
 
 # US 23
-def list_unique_name_birthday(indivs_df: pd.DataFrame) -> pd.DataFrame:
+def list_unique_name_birthday(indivs_df: IndivsOrContext) -> pd.DataFrame:
     """
     Detect all individuals with the same name and birth date
     :param indivs_df:
     :return:
     """
+    indivs_df = ValidationContext.of(indivs_df).indivs_df
     return indivs_df[indivs_df.duplicated(['NAME', 'BIRTHDAY'])]
 
 # US 30
-def list_living_married(indivs_df: pd.DataFrame) -> pd.DataFrame:
+def list_living_married(indivs_df: IndivsOrContext) -> pd.DataFrame:
     """
     List all living married people in a GEDCOM file 
     :param indivs_df:
     :return:
     """
+    indivs_df = ValidationContext.of(indivs_df).indivs_df
     spouse_df = indivs_df[indivs_df.SPOUSE.notnull()]
     living_df = spouse_df[spouse_df.DEATH.isnull()]
     return living_df
@@ -6,8 +6,10 @@ import datetime
 import pandas as pd
 from dateutil.parser import parse as parse_date
 from utils import *
+from gedcomParser.fileToDataframes import day_number, add_months
+from context import ValidationContext, IndivsOrContext
 from datetime import date
-from typing import List, Set, Tuple
+from typing import List, Set, Tuple, Union
 import itertools as it
 from dateutil.relativedelta import relativedelta
 import numpy as np
@@ -15,147 +17,133 @@ import numpy as np
 # US 42 - Reject illegitimate dates
 
 # US 32
-def multipleBirths(indivs_df: pd.DataFrame) -> pd.DataFrame:
+def multipleBirths(indivs_df: IndivsOrContext) -> pd.DataFrame:
     """
     Return all individuals who were born to the same family on the same day
     :param indivs_df:
     :return:
     """
-    birth_child_count = indivs_df.groupby(['BIRTHDAY', 'CHILD']).count()
+    indivs_df = ValidationContext.of(indivs_df).indivs_df
+    birth_child_count = indivs_df.groupby(['BIRTHDAY', 'CHILD'], observed=True).count()
     birth_child_multi = birth_child_count[birth_child_count['ID'] > 1]
     return indivs_df.merge(birth_child_multi.reset_index()[['BIRTHDAY', 'CHILD']])
 
 
 # US 33 - List Orphans
-def list_orphans(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> pd.DataFrame:
+def list_orphans(indivs_df: IndivsOrContext, families_df: pd.DataFrame = None) -> List[str]:
     """
     List all orphans (parents dead, current age under 18)
     :param indivs_df:
     :param families_df:
-    :return:
+    :return: ids of the orphans, each once
     """
+    ctx = ValidationContext.of(indivs_df, families_df)
+    indivs_df = ctx.indivs_df
+    both = ctx.join_both_spouses_to_family()
+    dead_couples = both[both['ALIVE_HUSBAND'].eq(False) & both['ALIVE_WIFE'].eq(False)]
+    # Every child of a dead couple once, with the age of the first individual with the child's id
+    children = child_edges(dead_couples).drop_duplicates('CHILD_ID')
+    ages = indivs_df.drop_duplicates('ID')[['ID', 'AGE']].rename(columns={'ID': 'CHILD_ID'})
+    children = children.merge(ages, on='CHILD_ID', sort=False)
+    return list(children.loc[children['AGE'] < 18, 'CHILD_ID'])
 
-    def getAge(indiv_id):
-        matches2 = indivs_df[indivs_df['ID'] == indiv_id]
-        if matches2 is not None:
-#            print("\n \n \n  MATCHES IS \n " + str(matches2))
-            return matches2['AGE'].values[0]        
-
-    both = join_both_spouses_to_family(indivs_df, families_df)
-    both_dead = pd.DataFrame()
-    any_dead_couples = False
-    orphanlist = []
-
-#    print("\n \n both is \n" + str(both))
-#    print("\n husband alive is \n" + str(both['ALIVE_HUSBAND']))
-#    print("\n wife alive is \n" + str(both['ALIVE_WIFE']))
-    for index, (ALIVE_HUSBAND, ALIVE_WIFE, wife_id, husb_id) in both[['ALIVE_HUSBAND', 'ALIVE_WIFE', 'ID_WIFE', 'ID_HUSBAND']].iterrows():
-        if (ALIVE_HUSBAND == False & ALIVE_WIFE == False):
-            any_dead_couples = True
-            temp = pd.DataFrame()
-            temp = both[(both['ID_WIFE'] == wife_id) & (both['ID_HUSBAND'] == husb_id)]
-            both_dead = pd.concat([both_dead, temp])
-
-#    print("\n \n both dead is \n" + str(both_dead))
-    if any_dead_couples:
-        dead_ppls_children = both_dead['CHILDREN'] #this is a series
-#    print("\n \n dead_ppls_children is \n" + str(dead_ppls_children))
-        for siblings in dead_ppls_children:
-#        print("\n siblings is " + str(siblings))
-            for child_id in siblings:
-                child_age = getAge(child_id)
-#            print("\n child age is " + str(child_age))
-                if child_age < 18:
-                    orphanlist.append(child_id)
-    return orphanlist
 
 # US 35
-def list_recent_births(indivs_df: pd.DataFrame) -> pd.DataFrame:
+def list_recent_births(indivs_df: IndivsOrContext) -> pd.DataFrame:
+    indivs_df = ValidationContext.of(indivs_df).indivs_df
     start_date = datetime.datetime.now() + datetime.timedelta(-30)
-    indivs_df = indivs_df[~indivs_df['BIRTHDAY'].isna()]
-    return indivs_df[indivs_df["BIRTHDAY"].apply(parse_date) > start_date]
+    return indivs_df[indivs_df["BIRTHDAY_DT"] > day_number(start_date)]
 
 
 # US 36
-def list_recent_deaths(indivs_df: pd.DataFrame) -> pd.DataFrame:
+def list_recent_deaths(indivs_df: IndivsOrContext) -> pd.DataFrame:
+    indivs_df = ValidationContext.of(indivs_df).indivs_df
     start_date = datetime.datetime.now() + datetime.timedelta(-30)
-    indivs_df = indivs_df[~indivs_df['DEATH'].isna()]
-    return indivs_df[indivs_df["DEATH"].apply(parse_date) > start_date]
+    return indivs_df[indivs_df["DEATH_DT"] > day_number(start_date)]
 
 
 # US 37
-def list_recent_survivors(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> pd.DataFrame:
+def list_recent_survivors(indivs_df: IndivsOrContext, families_df: pd.DataFrame = None) -> pd.DataFrame:
     """
     Returns the recent_deaths data-frame with two new columns: one for all living spouse of the decedent and one for
     all living descendants for the decedent :param indivs_df: :param families_df: :return:
     """
-    recent_deaths = list_recent_deaths(indivs_df)
-    recent_deaths['living spouses'] = [
-        {s for s in get_spouses(dead, families_df) if all(indivs_df[indivs_df['ID'] == s]['ALIVE'])}
-        for dead in recent_deaths['ID']]
-    recent_deaths['living descendants'] = [
-        {d for d in get_descendants(dead, families_df) if all(indivs_df[indivs_df['ID'] == d]['ALIVE'])}
-        for dead in recent_deaths['ID']]
+    ctx = ValidationContext.of(indivs_df, families_df)
+    indivs_df = ctx.indivs_df
+    recent_deaths = list_recent_deaths(indivs_df).copy()
+    # Individuals all of whose records are alive
+    alive = set(indivs_df['ID']) - set(indivs_df.loc[indivs_df['ALIVE'].eq(False), 'ID'])
+    links = ctx.family_links()
+    descendants = ctx.family_graph().descendants_of(recent_deaths['ID'])
+    recent_deaths['living spouses'] = [links.spouses_of(dead) & alive for dead in recent_deaths['ID']]
+    recent_deaths['living descendants'] = [set(descendants[dead] & alive) for dead in recent_deaths['ID']]
     return recent_deaths
 
 
 # US 38
-def list_upcoming_birthday(indivs_df: pd.DataFrame, test_today = None) -> pd.DataFrame:
+def list_upcoming_birthday(indivs_df: IndivsOrContext, test_today = None) -> pd.DataFrame:
     """
     List all living people in a GEDCOM file whose birthdays occur in the next 30 days
     """
+    indivs_df = ValidationContext.of(indivs_df).indivs_df
     if test_today:
         today_date = test_today
     else:
         today_date = date.today()
 
     indivs = indivs_df[indivs_df.DEATH.isna() & ~indivs_df.BIRTHDAY.isna()].copy()
-    curyear = today_date.year
-    indivs['DAYS_TO_BIRTHDAY'] = [None if pd.isna(birth) else
-                    ((date(curyear, parse_date(birth).date().month, parse_date(birth).date().day)) - today_date).days
-                    for birth in indivs['BIRTHDAY']]
+    indivs['DAYS_TO_BIRTHDAY'] = days_to_anniversary(indivs['BIRTHDAY_DT'], today_date)
     indivs = indivs[(indivs['DAYS_TO_BIRTHDAY'] <= 30) & (indivs['DAYS_TO_BIRTHDAY'] >= 0)]
+    indivs['DAYS_TO_BIRTHDAY'] = indivs['DAYS_TO_BIRTHDAY'].astype(int)
     return indivs
 
 
 # US39
-def list_upcoming_anniversaries(families_df: pd.DataFrame, test_today = None) -> pd.DataFrame:
+def list_upcoming_anniversaries(families_df: Union[pd.DataFrame, ValidationContext], test_today = None) -> pd.DataFrame:
     """
     List all living couples in a GEDCOM file whose marriage anniversaries occur in the next 30 days
     """
+    if isinstance(families_df, ValidationContext):
+        families_df = families_df.families_df
     if test_today:
         today_date = test_today
     else:
         today_date = date.today()
 
     fam_df = families_df[~families_df.MARRIED.isna()].copy()
-    curyear = today_date.year
-    fam_df['DAYS_TO_ANNIVERSARY'] = [None if pd.isna(married) else
-                    ((date(curyear, parse_date(married).date().month, parse_date(married).date().day)) - today_date).days
-                    for married in fam_df['MARRIED']]
+    fam_df['DAYS_TO_ANNIVERSARY'] = days_to_anniversary(fam_df['MARRIED_DT'], today_date)
     fam_df = fam_df[(fam_df['DAYS_TO_ANNIVERSARY'] <= 30) & (fam_df['DAYS_TO_ANNIVERSARY'] >= 0)]
+    fam_df['DAYS_TO_ANNIVERSARY'] = fam_df['DAYS_TO_ANNIVERSARY'].astype(int)
     return fam_df
 
 # US13
-def siblings_spacing(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> List[Tuple[str, str, int]]:
+def siblings_spacing(indivs_df: IndivsOrContext, families_df: pd.DataFrame = None) -> Set[Tuple[str, str, int]]:
     """
-     more than 8 months apart or less than 2 days apart
-    :return: 
+    Detect siblings whose births are more than 2 days and less than 8 months apart (twins are born less than 2 days
+    apart, other siblings more than 8 months apart). Siblings without birthday are skipped.
+    :return: set of (id of the elder sibling, id of the younger sibling, days between their births)
     """
-    def getBirthday(indiv_id):
-        matches = indivs_df[indivs_df['ID'] == indiv_id]
-        if matches is not None:
-            return parse_date(matches['BIRTHDAY'].values[0])
-
-    children: List[Set[str]] = families_df['CHILDREN']
-    child_pairs: List[List[Tuple[str, str]]] = [list(it.combinations(siblings, 2)) for siblings in children]
-    strange_children: List[Tuple[str, str, int]] = \
-        {(c1, c2, np.abs(relativedelta(getBirthday(c1), getBirthday(c2)).days))
-            for family_pairs in child_pairs for c1, c2 in family_pairs
-            if (np.abs(relativedelta(getBirthday(c1), getBirthday(c2)).days) > 2) and
-               (np.abs(relativedelta(getBirthday(c1), getBirthday(c2)).months) < 8)}
-    return strange_children
-
-
-
-
+    ctx = ValidationContext.of(indivs_df, families_df)
+    indivs_df, families_df = ctx.indivs_df, ctx.families_df
+    edges = child_edges(families_df)
+    # Birthday of every child link, from the first individual with the child's id
+    first = ~indivs_df['ID'].duplicated().values
+    positions = pd.Index(indivs_df['ID'].values[first]).get_indexer(edges['CHILD_ID'].values)
+    births = pd.DataFrame({'FAM_POS': edges['FAM_POS'].values, 'CHILD_ID': edges['CHILD_ID'].values,
+                           'BIRTHDAY_DT': pd.Series(indivs_df['BIRTHDAY_DT'].values[first]).reindex(positions).values})
+    births = births.dropna(subset=['BIRTHDAY_DT']).sort_values(['FAM_POS', 'BIRTHDAY_DT'], kind='mergesort')
+    if births.empty:
+        return set()
+    days = births['BIRTHDAY_DT'].values.astype(np.int64)
+    # Younger siblings in the forbidden window of every child are born at least 3 days and less than 8 months later:
+    # a slice of the siblings sorted by birthday, found by binary search on (family, day)
+    limit = add_months(births['BIRTHDAY_DT'], 8).values.astype(np.int64)
+    span = limit.max() - days.min() + 1
+    family = births['FAM_POS'].values * span - days.min()
+    keys = family + days
+    start = np.searchsorted(keys, family + days + 3)
+    end = np.maximum(np.searchsorted(keys, family + limit), start)
+    elder = np.repeat(np.arange(len(keys)), end - start)
+    younger = np.repeat(start - np.cumsum(end - start) + (end - start), end - start) + np.arange(len(elder))
+    ids = births['CHILD_ID'].values
+    return set(zip(ids[elder], ids[younger], (days[younger] - days[elder]).tolist()))
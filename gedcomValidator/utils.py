@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 
+import itertools
 import operator as op
 from functools import reduce
-from typing import Set
+from datetime import date
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
 
 import numpy as np
 import pandas as pd
@@ -10,18 +12,32 @@ from dateutil.parser import parse as parse_date
 from dateutil.relativedelta import relativedelta
 from tabulate import tabulate
 
+from gedcomParser.fileToDataframes import years_between, day_number, calendar_of, from_calendar
+
 
 def calc_delta_date(df: pd.DataFrame, date1_name, date2_name):
     """
-    Calculate delta date of two dates.
+    Calculate delta date of two dates in full years.
     :param df:
-    :param date1_name:
-    :param date2_name:
+    :param date1_name: name of a typed (day number) date column, e.g. BIRTHDAY_DT
+    :param date2_name: name of a typed (day number) date column, e.g. MARRIED_DT
     :return:
     """
-    return [np.nan if date1 is np.nan or date2 is np.nan else
-            relativedelta(parse_date(date2), parse_date(date1)).years
-            for date1, date2 in zip(df[date1_name], df[date2_name])]
+    return years_between(df[date1_name], df[date2_name])
+
+
+def days_to_anniversary(dates: pd.Series, today: date) -> pd.Series:
+    """
+    Calculate the days from today until the anniversary of every date in the current year.
+    :param dates: typed (day number) dates
+    :param today: reference date
+    :return: days until the anniversary (negative if it already passed this year), NaN if it does not exist this year
+    """
+    known = dates.notna().values
+    _, month, day = calendar_of(dates.values[known])
+    days = np.full(len(dates), np.nan)
+    days[known] = from_calendar(today.year, month, day) - day_number(today)
+    return pd.Series(days, index=dates.index)
 
 
 def get_surname(full_name):
@@ -75,35 +91,50 @@ def join_both_spouses_to_family(indivs_df: pd.DataFrame, families_df: pd.DataFra
              Individuals from indivs_df might occur multiple times if they participate in multiple families.
              They will not occur if they do not participate in any family.
     """
-    orig_colums = indivs_df.columns
-    indivs_df.columns = [c + "_HUSBAND" for c in orig_colums]
-    husbands: pd.DataFrame = indivs_df.merge(families_df, left_on='ID_HUSBAND', right_on='HUSBAND ID',
-                                             suffixes=('', '_fam'))
-    indivs_df.columns = [c + "_WIFE" for c in orig_colums]
-    both_spouses: pd.DataFrame = indivs_df.merge(husbands, left_on='ID_WIFE', right_on='WIFE ID', suffixes=('', '_fam'))
+    # add_suffix works on copies, so indivs_df is never modified (it might be shared between threads)
+    husbands: pd.DataFrame = indivs_df.add_suffix("_HUSBAND").merge(families_df, left_on='ID_HUSBAND',
+                                                                    right_on='HUSBAND ID', suffixes=('', '_fam'))
+    both_spouses: pd.DataFrame = indivs_df.add_suffix("_WIFE").merge(husbands, left_on='ID_WIFE', right_on='WIFE ID',
+                                                                     suffixes=('', '_fam'))
     both_spouses.rename(columns={'ID': 'ID_fam'}, inplace=True)
-    indivs_df.columns = orig_colums
     return both_spouses
 
 
+def child_edges(families_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Helper function to list every child link of the family-tree once.
+    :param families_df: Families dataframe
+    :return: Table with one row per (family, child) pair: the child's id (CHILD_ID) and the position (not the index
+             label) of the family in families_df (FAM_POS)
+    """
+    # Families without children may have no CHILDREN set (NaN or None) instead of an empty one
+    children = [c if isinstance(c, (set, frozenset)) else () for c in families_df['CHILDREN']]
+    # one FAM_POS per child, in the order the children come out of their sets
+    lengths = np.fromiter(map(len, children), dtype=np.int64, count=len(children))
+    return pd.DataFrame({'CHILD_ID': np.array(list(itertools.chain.from_iterable(children)), dtype=object),
+                         'FAM_POS': np.repeat(np.arange(len(children), dtype=np.int64), lengths)},
+                        columns=['CHILD_ID', 'FAM_POS'])
+
+
 def join_by_child(indivs_df: pd.DataFrame, families_df: pd.DataFrame) -> pd.DataFrame:
     """
     Helper function to join an individual to all families he participates in as a child.
-    :param indivs_df:
-    :param families_df:
-    :return:
+    Joins through the child links of the families, so it needs memory linear in the number of child links.
+    :param indivs_df: Individuals dataframe
+    :param families_df: Families dataframe
+    :return: Table listing all individuals together with the families they are a child in, colliding family columns
+             get the suffix _fam. Rows are ordered by individual, then family, and the index is the same as the one of
+             the former cartesian product of indivs_df and families_df (indiv_pos * len(families_df) + fam_pos).
     """
-    # Clone arguments
-    indivs_df_temp: pd.DataFrame = indivs_df.copy()
-    families_df_temp: pd.DataFrame = families_df.copy()
-    # Calculate cartesian product
-    indivs_df_temp['key'] = 0
-    families_df_temp['key'] = 0
-    product: pd.DataFrame = indivs_df_temp.merge(families_df_temp, on='key', suffixes=('', '_fam'))
-    # Remove helping column key
-    product = product[product.columns.drop('key')]
-    # Filter
-    return product[[Id in children for Id, children in zip(product['ID'], product['CHILDREN'])]]
+    indivs_pos = pd.DataFrame({'CHILD_ID': indivs_df['ID'].values,
+                               'INDIV_POS': np.arange(len(indivs_df), dtype=np.int64)})
+    edges = indivs_pos.merge(child_edges(families_df), on='CHILD_ID').sort_values(['INDIV_POS', 'FAM_POS'])
+    indivs = indivs_df.iloc[edges['INDIV_POS'].values].reset_index(drop=True)
+    families = families_df.iloc[edges['FAM_POS'].values].reset_index(drop=True)
+    families.columns = [c + '_fam' if c in indivs.columns else c for c in families.columns]
+    joined = pd.concat([indivs, families], axis=1)
+    joined.index = edges['INDIV_POS'].values * len(families_df) + edges['FAM_POS'].values
+    return joined
 
 
 def tabulate_df(df: pd.DataFrame) -> str:
@@ -119,20 +150,29 @@ def get_descendants(individual_id, fams_df) -> Set[str]:
     """
     Given an individual, return all his/her descendants
     :param individual_id: id of an individual
-    :param fams_df: families data-frame holding the family-tree
+    :param fams_df: families data-frame holding the family-tree, or (for many queries, which then share one index and
+                    its remembered answers) its FamilyGraph or a ValidationContext of it
     :return: set of individual-ids of all descendants
     """
-    children = get_children(individual_id, fams_df)
-    return children | reduce(op.or_, [get_descendants(c, fams_df) for c in children], set())
+    if isinstance(fams_df, pd.DataFrame):
+        graph = FamilyGraph(fams_df)
+    elif hasattr(fams_df, 'family_graph'):
+        graph = fams_df.family_graph()
+    else:
+        graph = fams_df
+    return set(graph.descendants(individual_id))
 
 
 def get_children(individual_id, fams_df) -> Set[str]:
     """
     Given an individual, return all his/her children
     :param individual_id: id of an individual
-    :param fams_df: families data-frame holding the family-tree
+    :param fams_df: families data-frame holding the family-tree, or its FamilyLinks (array slices instead of scanning
+                    the families, for many queries)
     :return: set of individual-ids of all children
     """
+    if isinstance(fams_df, FamilyLinks):
+        return fams_df.children_of(individual_id)
     families = fams_df[(fams_df['HUSBAND ID'] == individual_id) | (fams_df['WIFE ID'] == individual_id)]
     children = reduce(op.or_, families['CHILDREN'], set())
     return children
@@ -142,8 +182,11 @@ def get_children_of_couple(husband_id, wife_id, fams_df) -> Set[str]:
     Given a husband's id and a wife's id, get the children of that couple
     :param wife_id: id of wife
     :param husband_id: id of husband
+    :param fams_df: families data-frame holding the family-tree, or its FamilyLinks
     :return: set of individual-ids of all children of given couple
     """
+    if isinstance(fams_df, FamilyLinks):
+        return fams_df.children_of_couple(husband_id, wife_id)
     families = fams_df[(fams_df['HUSBAND ID'] == husband_id) & (fams_df['WIFE ID'] == wife_id)]
     children = reduce(op.or_, families['CHILDREN'], set())
     return children 
@@ -152,8 +195,157 @@ def get_spouses(individual_id, fams_df) -> Set[str]:
     """
     Given an individual, return all his/her (ex)spouses
     :param individual_id: id of an individual
-    :param fams_df: families data-frame holding the family-tree
+    :param fams_df: families data-frame holding the family-tree, or its FamilyLinks
     :return: set of individual-ids of all (ex)spouses
     """
+    if isinstance(fams_df, FamilyLinks):
+        return fams_df.spouses_of(individual_id)
     return set(fams_df[fams_df['HUSBAND ID'] == individual_id]['WIFE ID']) \
         | set(fams_df[fams_df['WIFE ID'] == individual_id]['HUSBAND ID'])
+
+
+def csr(rows: np.ndarray, values: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compressed sparse rows of the pairs (rows[i], values[i]).
+    :param n: number of rows
+    :return: offsets, index: the values of row r are index[offsets[r]:offsets[r + 1]], in the order of the pairs
+    """
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=offsets[1:])
+    return offsets, values[np.argsort(rows, kind='stable')]
+
+
+class FamilyLinks:
+    """
+    The links of the family-tree as integer arrays, built once from the families data-frame. Every individual-id that
+    occurs in a family (as husband, wife or child) is interned to a dense integer code (ids[code] is the id). Missing
+    ids and individuals in no family get the code -1, which has no children, spouses, parents or families. Families
+    are numbered by their position in the data-frame. The children of every family and the families every individual
+    is a spouse in are compressed sparse rows, so looking them up is an array slice:
+    the children of family f are child_index[child_offsets[f]:child_offsets[f + 1]].
+    """
+
+    def __init__(self, fams_df: pd.DataFrame):
+        edges = child_edges(fams_df)
+        husbands = fams_df['HUSBAND ID'].values.astype(object)
+        wives = fams_df['WIFE ID'].values.astype(object)
+        codes, self.ids = pd.factorize(np.concatenate([husbands, wives, edges['CHILD_ID'].values.astype(object)]))
+        self.codes: Dict[str, int] = dict(zip(self.ids, range(len(self.ids))))
+        n_fams = len(fams_df)
+        self.husband, self.wife, children = codes[:n_fams], codes[n_fams:2 * n_fams], codes[2 * n_fams:]
+        self.child_offsets, self.child_index = csr(edges['FAM_POS'].values, children, n_fams)
+        fams = np.arange(n_fams, dtype=np.int64)
+        spouses = np.concatenate([self.husband, self.wife])
+        known = spouses >= 0
+        self.spouse_offsets, self.spouse_index = csr(spouses[known], np.concatenate([fams, fams])[known],
+                                                     len(self.ids))
+
+    def code(self, individual_id: str) -> int:
+        """:return: code of individual_id, -1 if it is in no family"""
+        return self.codes.get(individual_id, -1) if isinstance(individual_id, str) else -1
+
+    def children(self, family: int) -> np.ndarray:
+        """:return: codes of the children of the family at position family"""
+        return self.child_index[self.child_offsets[family]:self.child_offsets[family + 1]]
+
+    def spouse_families(self, code: int) -> np.ndarray:
+        """:return: positions of the families the individual with code is husband or wife in"""
+        return self.spouse_index[self.spouse_offsets[code]:self.spouse_offsets[code + 1]] if code >= 0 \
+            else self.spouse_index[:0]
+
+    def children_of(self, individual_id: str) -> Set[str]:
+        """:return: individual-ids of the children of all families of individual_id"""
+        return {self.ids[c] for f in self.spouse_families(self.code(individual_id)) for c in self.children(f)}
+
+    def children_of_couple(self, husband_id: str, wife_id: str) -> Set[str]:
+        """:return: individual-ids of the children of all families with this husband and wife"""
+        husband, wife = self.code(husband_id), self.code(wife_id)
+        if wife < 0:
+            return set()
+        return {self.ids[c] for f in self.spouse_families(husband)
+                if self.husband[f] == husband and self.wife[f] == wife for c in self.children(f)}
+
+    def spouses_of(self, individual_id: str) -> Set[str]:
+        """:return: individual-ids of the (ex)spouses of individual_id"""
+        code = self.code(individual_id)
+        spouses = set()
+        for f in self.spouse_families(code):
+            spouses.update(s for s, other in ((self.wife[f], self.husband[f]), (self.husband[f], self.wife[f]))
+                           if other == code and s >= 0)
+        return {self.ids[s] for s in spouses}
+
+    def parent_child_pairs(self) -> Tuple[np.ndarray, np.ndarray]:
+        """:return: codes of parents and of their children, one pair per parent of every child link"""
+        families = np.repeat(np.arange(len(self.husband), dtype=np.int64), np.diff(self.child_offsets))
+        parents = np.concatenate([self.husband[families], self.wife[families]])
+        children = np.concatenate([self.child_index, self.child_index])
+        known = parents >= 0
+        return parents[known], children[known]
+
+
+class FamilyGraph:
+    """
+    Index of the family-tree built once from the families data-frame: who are the children and who are the parents of
+    every individual, as compressed sparse rows over the codes of FamilyLinks. Descendant and ancestor queries walk the
+    index iteratively, so they terminate on cyclic trees (an individual in a cycle is his/her own descendant), and
+    remember every answer.
+    """
+
+    def __init__(self, fams_df: pd.DataFrame, links: FamilyLinks = None):
+        """:param links: FamilyLinks of fams_df, if already built"""
+        self.links = FamilyLinks(fams_df) if links is None else links
+        parents, children = self.links.parent_child_pairs()
+        n = len(self.links.ids)
+        self.children = csr(parents, children, n)
+        self.parents = csr(children, parents, n)
+        self._ids: List[str] = self.links.ids.tolist()
+        self._descendants: Dict[int, FrozenSet[str]] = {}
+        self._ancestors: Dict[int, FrozenSet[str]] = {}
+
+    def descendants(self, individual_id: str) -> FrozenSet[str]:
+        """
+        :param individual_id: id of an individual
+        :return: individual-ids of all descendants (children, grandchildren, ...)
+        """
+        return self._closure(self.links.code(individual_id), self.children, self._descendants)
+
+    def ancestors(self, individual_id: str) -> FrozenSet[str]:
+        """
+        :param individual_id: id of an individual
+        :return: individual-ids of all ancestors (parents, grandparents, ...)
+        """
+        return self._closure(self.links.code(individual_id), self.parents, self._ancestors)
+
+    def descendants_of(self, individual_ids: Iterable[str]) -> Dict[str, FrozenSet[str]]:
+        """Bulk version of descendants: map every individual-id to its descendants"""
+        return {i: self.descendants(i) for i in individual_ids}
+
+    def ancestors_of(self, individual_ids: Iterable[str]) -> Dict[str, FrozenSet[str]]:
+        """Bulk version of ancestors: map every individual-id to its ancestors"""
+        return {i: self.ancestors(i) for i in individual_ids}
+
+    def _closure(self, start: int, edges: Tuple[np.ndarray, np.ndarray], memo: Dict[int, FrozenSet[str]]) \
+            -> FrozenSet[str]:
+        """
+        All individuals reachable from the code start over edges (compressed sparse rows, not including start itself,
+        unless it lies on a cycle). Reachable individuals whose closure is already memoized are not walked again.
+        """
+        if start < 0:
+            return frozenset()
+        if start in memo:
+            return memo[start]
+        offsets, index = edges
+        reached: Set[str] = set()
+        stack = index[offsets[start]:offsets[start + 1]].tolist()
+        while stack:
+            code = stack.pop()
+            individual_id = self._ids[code]
+            if individual_id in reached:
+                continue
+            reached.add(individual_id)
+            if code in memo:
+                reached |= memo[code]
+            else:
+                stack.extend(index[offsets[code]:offsets[code + 1]].tolist())
+        memo[start] = frozenset(reached)
+        return memo[start]
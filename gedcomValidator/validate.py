@@ -8,177 +8,326 @@ from tabulate import tabulate
 from dateutil.parser import parse as parse_date
 from dateutil.relativedelta import relativedelta
 import numpy as np
-from typing import Tuple
+from typing import Iterator, List, Set, Tuple
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 from datetime import date
 from sprint_1_stories import *
 from sprint_2_stories import *
 from sprint_3_stories import *
 from sprint_4_stories import *
+from context import ValidationContext
+from registry import ERROR, NOTICE, Rule, rule, select_rules, is_selected, required_tables, story_ids, \
+    parse_story_ids
+from report import Anomaly, writers
+from profiler import Profiler, stage_of
+from gedcomParser.parseCache import ParseCache, DEFAULT_MAX_BYTES
+from incremental import run_incremental
+
+def run_all_checks(filename: str, jobs: int = 1, only: Set[str] = None, skip: Set[str] = None,
+                   output_format: str = 'text', profiler: Profiler = None, cache: ParseCache = None,
+                   state_file: str = None, compact: bool = False) -> Counter:
+    """
+    Parse a GEDCOM file, print the individuals and families tables and the messages of the selected user stories.
+    :param filename: path of the GEDCOM file
+    :param jobs: number of threads running the user stories, the messages are printed in the same order either way
+    :param only: ids of the user stories to run (all if None)
+    :param skip: ids of the user stories not to run
+    :param output_format: text prints the tables and messages, jsonl and csv only write the anomalies as records
+                          (see report.py)
+    :param profiler: measures parsing, printing the tables, the joins and every user story
+    :param cache: cache of parsed files, a file found in it is not parsed again
+    :param state_file: re-validate incrementally: only re-run the user stories on the records that changed since the
+                       run that wrote state_file (see incremental.py)
+    :param compact: store the individuals and families in compact dtypes (see fileToDataframes.compact_dfs)
+    :return: number of anomalies by user story id
+    """
+    writer = writers[output_format](sys.stdout)
+    text = output_format == 'text'
+    counts = Counter()
+    # In text mode the parser prints US42 errors right away, otherwise they become anomalies like all others
+    parser_anomalies = []
+
+    def on_illegitimate_date(date: str):
+        if is_selected('US42', only, skip):
+            anomaly = Anomaly('US42', ERROR, 'PARSER', "DATE '{}' is illegitimate".format(date), {'DATE': date})
+            counts[anomaly.story_id] += 1
+            if text:
+                print(anomaly.text)
+            else:
+                parser_anomalies.append(anomaly)
+
+    indivs_df, families_df = gedcomParser.fileToDataframes.parseFileToDFs(
+        filename, on_illegitimate_date=on_illegitimate_date, profiler=profiler, cache=cache, compact=compact)
+    # All user stories share the joins computed by this context, joins no selected story needs are never computed
+    ctx = ValidationContext(indivs_df, families_df)
+
+    stage = stage_of(profiler)
+
+    if text:
+        print("\nIndividuals:")
+        with stage('individuals table', len(indivs_df)) as profile:
+            print(tabulate_df(indivs_df[gedcomParser.fileToDataframes.indivs_display_columns]))
+            profile.rows_out = len(indivs_df)
+        print()
+        print("Families:")
+        if is_selected('US28', only, skip):
+            with stage('US28', len(families_df)) as profile:
+                families_df = order_siblings_by_age(ctx)
+                profile.rows_out = len(families_df)
+        with stage('families table', len(families_df)) as profile:
+            print(tabulate_df(families_df[gedcomParser.fileToDataframes.fams_display_columns]))
+            profile.rows_out = len(families_df)
+        print()
+
+        print("\n+---------------------------------------------+")
+        print("|NOTE: US 41 and US 42 print above the tables!|")
+        print("+---------------------------------------------+\n")
+    else:
+        writer.write(parser_anomalies)
+    selected = select_rules(only, skip)
+    if state_file is None:
+        results = run_checks(ctx, selected, jobs, profiler)
+    else:
+        results = run_incremental(ctx, selected, state_file, lambda c, rs: run_checks(c, rs, jobs, profiler))
+    for anomalies in results:
+        writer.write(anomalies)
+        counts.update(a.story_id for a in anomalies)
+    return counts
+
+
+def run_checks(ctx: ValidationContext, selected: List[Rule], jobs: int = 1, profiler: Profiler = None) \
+        -> Iterator[List[Anomaly]]:
+    """
+    Run rules on one file.
+    :param ctx: context of the file
+    :param selected: rules to run
+    :param jobs: number of threads; the stories only read the data-frames and share the joins of ctx
+    :param profiler: measures every join and every rule (as a stage named by its story id)
+    :return: the anomalies found by every rule, in the order of selected
+    """
+    stage = stage_of(profiler)
+    rows_in = len(ctx.indivs_df) + len(ctx.families_df)
+
+    def derive(name: str):
+        with stage(name, rows_in) as profile:
+            table = ctx.derived(name)
+            profile.rows_out = len(table) if isinstance(table, pd.DataFrame) else None
+
+    def check(r: Rule) -> List[Anomaly]:
+        with stage(r.story_id, rows_in) as profile:
+            anomalies = r.anomalies(ctx)
+            profile.rows_out = len(anomalies)
+        return anomalies
+
+    if jobs <= 1:
+        if profiler is not None:
+            # Measure the joins on their own instead of as part of the first story using them
+            for name in required_tables(selected):
+                derive(name)
+        for r in selected:
+            yield check(r)
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # Compute the joins first, each on its own thread, so that no story waits for the join of another one
+        list(pool.map(derive, required_tables(selected)))
+        futures = [pool.submit(check, r) for r in selected]
+        # Yield in submission order, no matter which story finishes first. A story that raises re-raises here, after
+        # the anomalies of all earlier stories, just like in a sequential run.
+        for future in futures:
+            yield future.result()
+
+
+# Rules of all user stories, registered in the order their messages are printed.
+# US 41 and US 42 are implemented in fileToDicts.py via methods date_is_legitimate() and finish_date(), along with some
+# editing of parse_date(), so they print while the file is parsed. US 27 and US 28 are shown in the tables.
+
+## Sprint 1
+# US 01
+def _dates_before_current_date(ctx: ValidationContext) -> Tuple[pd.DataFrame, ...]:
+    return ctx.table('dates_before_current_date', lambda: dates_before_current_date(ctx))
+
+
+rule('US01', ERROR, 'INDIVIDUAL', "{}: Dates before current date - Birth {}", ['ID', 'BIRTHDAY'], anchor='ID')(
+    lambda ctx: _dates_before_current_date(ctx)[0])
+rule('US01', ERROR, 'INDIVIDUAL', "{}: Dates before current date - Death {}", ['ID', 'DEATH'], anchor='ID')(
+    lambda ctx: _dates_before_current_date(ctx)[1])
+rule('US01', ERROR, 'FAMILIES', "{}: Dates before current date - Married {}", ['ID', 'MARRIED'], anchor='ID')(
+    lambda ctx: _dates_before_current_date(ctx)[2])
+rule('US01', ERROR, 'FAMILIES', "{}: Dates before current date - Divorced {}", ['ID', 'DIVORCED'], anchor='ID')(
+    lambda ctx: _dates_before_current_date(ctx)[3])
+
+# US 02
+rule('US02', ERROR, 'INDIVIDUAL', "{}: Birth should occur before marriage - Birthday {}: MARRIED {}",
+     ['ID', 'BIRTHDAY', 'MARRIED'], tables=['join_by_spouse'], anchor='ID')(birth_before_marriage)
+
+# US 03
+rule('US03', ERROR, 'INDIVIDUAL', "{}: Birth should occur before death - Birthday {}: Death {}",
+     ['ID', 'BIRTHDAY', 'DEATH'], anchor='ID')(birth_before_death)
+
+# US 04
+rule('US04', ERROR, 'INDIVIDUAL', "{}: Marriage after divorce - Marriage {}: Divorce {}",
+     ['ID', 'MARRIED', 'DIVORCED'], tables=['join_by_spouse'], anchor='ID')(marriage_before_divorce)
+
+# US 05
+rule('US05', ERROR, 'INDIVIDUAL', "{}: Marriage after death - Marriage {}: Death {}",
+     ['ID', 'MARRIED', 'DEATH'], tables=['join_by_spouse'], anchor='ID')(marriage_before_death)
+
+# US 06
+rule('US06', ERROR, 'INDIVIDUAL', "{}: Divorced after death - Divorce {}: Death {}",
+     ['ID', 'DIVORCED', 'DEATH'], tables=['join_by_spouse'], anchor='ID')(divorce_before_death)
+
+# US 07
+rule('US07', ERROR, 'INDIVIDUAL', "{}: More than 150 years old - Birth {}: Death {}",
+     ['ID', 'BIRTHDAY', 'DEATH'], anchor='ID')(less_than_150_years_old)
+
+# US 08
+rule('US08', ERROR, 'INDIVIDUAL', "{}: Individual's birthday is before parents' marriage date -  {}",
+     ['ID', 'MARRIED'], anchor='ID')(birth_before_parents_married)
+
+## Sprint 2
+# US 09
+rule('US09', ERROR, 'INDIVIDUAL', "{}: Individual's birthday is after mother's death date - {} Mother: {} - {}",
+     ['ID_c', 'BIRTHDAY_c', 'ID_m', 'DEATH_m'], anchor='ID_c')(birth_before_parents_death_mother)
+rule('US09', ERROR, 'INDIVIDUAL', "{}: Individual's birthday is after father's death date - {} Father: {} - {}",
+     ['ID_c', 'BIRTHDAY_c', 'ID_m', 'DEATH_m'], anchor='ID_c')(birth_before_parents_death_father)
+
+# US 10
+rule('US10', ERROR, 'INDIVIDUAL', "{}: Individual married before the age of 14 - Age at marriage: {}",
+     ['ID', 'AGE_MARRIED'], tables=['join_by_spouse'], anchor='ID')(marriage_before_14)
+
+# US 12
+rule('US12', ERROR, 'INDIVIDUAL', "{}'s mother {} is too old. Older then individual {} years.",
+     ['ID', 'ID_idv_mother', 'DIFF_MOTHER'], anchor='ID')(mother_too_old)
+rule('US12', ERROR, 'INDIVIDUAL', "{}'s father {} is too old. Older then individual {} years.",
+     ['ID', 'ID_idv_father', 'DIFF_FATHER'], anchor='ID')(father_too_old)
+
+# US 14
+rule('US14', ERROR, 'FAMILY', "{0} have {2} birth which more than 5 birth in same day: {1}.",
+     ['CHILD', 'BIRTHDAY', 'CHILDREN'], anchor='CHILD')(multiple_births_5)
+
+# US 15
+rule('US15', ERROR, 'FAMILY', "In family {} there are more then 14 children.", ['ID'], anchor='ID')(
+    fewer_than_15_siblings)
+
+# US 16
+rule('US16', ERROR, 'INDIVIDUAL', "{} name is: {}. Fathers name is: {}", ['ID', 'NAME', 'HUSBAND NAME'],
+     tables=['join_by_child'], anchor='ID')(same_male_last_name)
+
+# US 18
+rule('US18', ERROR, 'INDIVIDUAL', "{1} and {2} are siblings but they are married in family {0}",
+     ['ID_fam', 'ID_HUSBAND', 'ID_WIFE'], tables=['join_both_spouses_to_family'], anchor='ID_fam')(
+    siblings_should_not_marry)
+
+# US 21
+rule('US21', ERROR, 'INDIVIDUAL', "{} has the wrong gender role in family {}", ['ID', 'ID_fam'],
+     tables=['join_by_spouse'], anchor='ID')(correct_gender_for_role)
+
+## Sprint 3
+# US 22
+rule('US22', ERROR, 'INDIVIDUAL/FAMILY', "ID {} already exists", ['ID'])(unique_ids)
+
+# US 23
+rule('US23', ERROR, 'INDIVIDUAL', "Name: {} and Birthday: {} already exists", ['NAME', 'BIRTHDAY'])(
+    list_unique_name_birthday)
+
+# US 25
+rule('US25', ERROR, 'INDIVIDUAL',
+     "Individual with ID {} has same name ({}) and birthday ({}) as other individual in the family",
+     ['ID', 'NAME', 'BIRTHDAY'], tables=['join_by_child'], anchor='ID')(unique_first_names_in_families)
 
-def run_all_checks(filename: str):
-    indivs_df, families_df = gedcomParser.fileToDataframes.parseFileToDFs(filename)
-
-    print("\nIndividuals:")
-    print(tabulate_df(indivs_df))
-    print()
-    print("Families:")
-    print(tabulate_df(order_siblings_by_age(indivs_df, families_df)))
-    print()
-
-    print("\n+---------------------------------------------+")
-    print("|NOTE: US 41 and US 42 print above the tables!|")
-    print("+---------------------------------------------+\n")
-    ## Sprint 1
-    # US 01
-    inds_birth, inds_death, fams_marriage, fams_divorce = dates_before_current_date(indivs_df, families_df)
-    for index, (indiv_id, birth) in inds_birth[['ID', 'BIRTHDAY']].iterrows():
-            print("ERROR: INDIVIDUAL: US01: {}: Dates before current date - Birth {}".format(indiv_id, birth))
-    for index, (indiv_id, death) in inds_death[['ID', 'DEATH']].iterrows():
-            print("ERROR: INDIVIDUAL: US01: {}: Dates before current date - Death {}".format(indiv_id, death))
-    for index, (family_id, married) in fams_marriage[['ID', 'MARRIED']].iterrows():
-            print("ERROR: FAMILIES: US01: {}: Dates before current date - Married {}".format(family_id, married))
-    for index, (family_id, divorce) in fams_divorce[['ID', 'DIVORCED']].iterrows():
-            print("ERROR: FAMILIES: US01: {}: Dates before current date - Divorced {}".format(family_id, divorce))
-
-    # US 02
-    for index, (indiv_id, birth, marriage) in birth_before_marriage(indivs_df, families_df)[['ID', 'BIRTHDAY', 'MARRIED']].iterrows():
-        print("ERROR: INDIVIDUAL: US02: {}: Birth should occur before marriage - Birthday {}: MARRIED {}".format(indiv_id, birth, marriage))
-
-    # US 03
-    for index, (indiv_id, birth, death) in birth_before_death(indivs_df)[['ID', 'BIRTHDAY', 'DEATH']].iterrows():
-        print("ERROR: INDIVIDUAL: US03: {}: Birth should occur before death - Birthday {}: Death {}".format(indiv_id, birth, death))
-
-    # US 04
-    for index, (indiv_id, marriage, divorce) in marriage_before_divorce(indivs_df, families_df)[['ID', 'MARRIED', 'DIVORCED']].iterrows():
-        print("ERROR: INDIVIDUAL: US04: {}: Marriage after divorce - Marriage {}: Divorce {}".format(indiv_id, marriage, divorce))
-
-    # US 05
-    for index, (indiv_id, marriage, death) in marriage_before_death(indivs_df, families_df)[['ID', 'MARRIED', 'DEATH']].iterrows():
-        print("ERROR: INDIVIDUAL: US05: {}: Marriage after death - Marriage {}: Death {}".format(indiv_id, marriage, death))
-
-    # US 06
-    for index, (indiv_id, divorce, death) in divorce_before_death(indivs_df, families_df)[['ID', 'DIVORCED', 'DEATH']].iterrows():
-        print("ERROR: INDIVIDUAL: US06: {}: Divorced after death - Divorce {}: Death {}".format(indiv_id, divorce, death))
-
-    # US 07
-    for index, (indiv_id, birth, death) in less_than_150_years_old(indivs_df)[['ID', 'BIRTHDAY', 'DEATH']].iterrows():
-        print("ERROR: INDIVIDUAL: US07: {}: More than 150 years old - Birth {}: Death {}".format(indiv_id, birth, death))
-
-    # US 08
-    merge = birth_before_parents_married(indivs_df, families_df)
-    if not merge.empty:
-        for index, (indiv_id, marr) in merge[['ID', 'MARRIED']].iterrows():
-            print("ERROR: INDIVIDUAL: US08: {}: Individual's birthday is before parents' marriage date -  {}".format(indiv_id, marr))
-
-    ## Sprint 2
-    # US 09
-    mom = birth_before_parents_death_mother(indivs_df, families_df)
-    dad = birth_before_parents_death_father(indivs_df, families_df)
-    for index, (indiv_id, birth, mother_id, death) in mom.iterrows():
-        print("ERROR: INDIVIDUAL: US09: {}: Individual's birthday is after mother's death date - {} Mother: {} - {}".format(indiv_id, birth, mother_id, death))
-    for index, (indiv_id, birth, father_id, death) in dad.iterrows():
-        print("ERROR: INDIVIDUAL: US09: {}: Individual's birthday is after father's death date - {} Father: {} - {}".format(indiv_id, birth, father_id, death))
-
-    # US 10
-    for index, (indiv_id, age) in marriage_before_14(indivs_df, families_df)[['ID', 'AGE_MARRIED']].iterrows():
-        print("ERROR: INDIVIDUAL: US10: {}: Individual married before the age of 14 - Age at marriage: {}".format(indiv_id, age))
-
-    # US 12
-    for index, (indiv_id, mother_id, diff_age) in mother_too_old(indivs_df, families_df)[['ID', 'ID_idv_mother', 'DIFF_MOTHER']].iterrows():
-        print("ERROR: INDIVIDUAL: US12: {}'s mother {} is too old. Older then individual {} years.".format(indiv_id, mother_id, diff_age))
-    for index, (indiv_id, father_id, diff_age) in father_too_old(indivs_df, families_df)[['ID', 'ID_idv_father', 'DIFF_FATHER']].iterrows():
-        print("ERROR: INDIVIDUAL: US12: {}'s father {} is too old. Older then individual {} years.".format(indiv_id, father_id, diff_age))
-
-    # US 14
-    for index, (fams_id, birthday, nums) in multiple_births_5(indivs_df, families_df)[['CHILD', 'BIRTHDAY', 'CHILDREN']].iterrows():
-        print("ERROR: FAMILY: US14: {} have {} birth which more than 5 birth in same day: {}.".format(fams_id, nums, birthday))
-
-    # US 15
-    for family_id in fewer_than_15_siblings(indivs_df, families_df)["ID"]:
-        print("ERROR: FAMILY: US15: In family {} there are more then 14 children.".format(family_id))
-
-    # US 16
-    for index, (child_id, child_name, father_name) in same_male_last_name(indivs_df, families_df)[["ID", "NAME", "HUSBAND NAME"]].iterrows():
-        print("ERROR: INDIVIDUAL: US16: {} name is: {}. Fathers name is: {}".format(child_id, child_name, father_name))
-
-    # US 18
-    for index, (id_fam, id_husb, id_wife) in siblings_should_not_marry(indivs_df, families_df)[['ID_fam', 'ID_HUSBAND', 'ID_WIFE']].iterrows():
-        print("ERROR: INDIVIDUAL: US18: {} and {} are siblings but they are married in family {}".format(id_husb, id_wife, id_fam))
-
-    # US 21
-    for index, (id, id_fam) in correct_gender_for_role(indivs_df, families_df)[['ID', 'ID_fam']].iterrows():
-        print("ERROR: INDIVIDUAL: US21: {} has the wrong gender role in family {}".format(id, id_fam))
-
-
-    ## Sprint 3
-    # US 22
-    for index, series in unique_ids(indivs_df, families_df)[['ID']].iterrows():
-        print("ERROR: INDIVIDUAL/FAMILY: US22: ID {} already exists".format(series["ID"]))
-
-    # US 23
-    for index, (name, birthday) in list_unique_name_birthday(indivs_df)[['NAME', 'BIRTHDAY']].iterrows():
-        print("ERROR: INDIVIDUAL: US23: Name: {} and Birthday: {} already exists".format(name, birthday))
-
-    # US 25
-    for index, (id, name, birthday) in unique_first_names_in_families(indivs_df, families_df)[['ID', 'NAME', 'BIRTHDAY']].iterrows():
-        print("ERROR: INDIVIDUAL: US25: Individual with ID {} has same name ({}) and birthday ({}) as other individual in the family".format(id, name, birthday))
-
-    # US 29
-    for index, (id, birth, death) in list_deceased(indivs_df)[['ID', 'BIRTHDAY', 'DEATH']].iterrows():
-        print("NOTICE: INDIVIDUAL: US29: {} is dead. BIRTHDAY: {} - DEATH DATE: {}".format(id, birth, death))
-
-    # US 30
-    for index, (id, name) in list_living_married(indivs_df)[['ID', 'NAME']].iterrows():
-        print("NOTICE: INDIVIDUAL: US30: Individual with ID: {} Name: {} are living and married".format(id, name))
-
-    # US 31
-    for index, (id, age) in list_living_single_older_than_30(indivs_df)[['ID', 'AGE']].iterrows():
-        print("NOTICE: INDIVIDUAL: US31: {} has never been married and is older than 30 with an age of {}".format(id, age))
-
-
-    ## Sprint 4
-
-    # US 32
-    for index, (id, birth, child) in multipleBirths(indivs_df)[['ID', 'BIRTHDAY', 'CHILD']].iterrows():
-        print("NOTICE: INDIVIDUAL: US32: {} is one of multiple children born to the {} family on {}".format(id, child, birth))
-
-    # US 42 && 41
-    # !!! Stories implemented in fileToDicts.py via methods date_is_legitimate() and finish_date(), along with some editing of parse_date() !!!
-
-    # US 35
-    for index, (id, name) in list_recent_births(indivs_df)[['ID', 'NAME']].iterrows():
-        print("NOTICE: INDIVIDUAL: US35: {} was born in the last 30 days".format(name))
-
-    # US 36
-    for index, (id, name) in list_recent_deaths(indivs_df)[['ID', 'NAME']].iterrows():
-        print("NOTICE: INDIVIDUAL: US36: {} died in the last 30 days".format(name))
+# US 29
+rule('US29', NOTICE, 'INDIVIDUAL', "{} is dead. BIRTHDAY: {} - DEATH DATE: {}", ['ID', 'BIRTHDAY', 'DEATH'],
+     anchor='ID')(list_deceased)
+
+# US 30
+rule('US30', NOTICE, 'INDIVIDUAL', "Individual with ID: {} Name: {} are living and married", ['ID', 'NAME'],
+     anchor='ID')(list_living_married)
+
+# US 31
+rule('US31', NOTICE, 'INDIVIDUAL', "{} has never been married and is older than 30 with an age of {}",
+     ['ID', 'AGE'], anchor='ID')(list_living_single_older_than_30)
+
+## Sprint 4
+# US 32
+rule('US32', NOTICE, 'INDIVIDUAL', "{0} is one of multiple children born to the {2} family on {1}",
+     ['ID', 'BIRTHDAY', 'CHILD'], anchor='ID')(multipleBirths)
+
+# US 35
+rule('US35', NOTICE, 'INDIVIDUAL', "{1} was born in the last 30 days", ['ID', 'NAME'], anchor='ID')(list_recent_births)
 
-    # US 37
-    for index, (id, spouses, desc) \
-            in list_recent_survivors(indivs_df, families_df)[['ID', 'living spouses', 'living descendants']].iterrows():
-        print("NOTICE: INDIVIDUAL: US37: {} died in the last 30 days. He/She leaves behind his/her spouse(s) {} and "
-              "his/her descendant {}".format(id, spouses, desc))
+# US 36
+rule('US36', NOTICE, 'INDIVIDUAL', "{1} died in the last 30 days", ['ID', 'NAME'], anchor='ID')(list_recent_deaths)
+
+# US 37
+rule('US37', NOTICE, 'INDIVIDUAL',
+     "{} died in the last 30 days. He/She leaves behind his/her spouse(s) {} and his/her descendant {}",
+     ['ID', 'living spouses', 'living descendants'],
+     tables=['family_links', 'family_graph'])(list_recent_survivors)
 
-    # US 38
-    for index, (id, name, days_to_birthday) in list_upcoming_birthday(indivs_df)[['ID', 'NAME', 'DAYS_TO_BIRTHDAY']].iterrows():
-        print("NOTICE: INDIVIDUAL: US38: {} {}'s birthdays occur in the next 30 days ({} days) ".format(id, name, days_to_birthday))
+# US 38
+rule('US38', NOTICE, 'INDIVIDUAL', "{} {}'s birthdays occur in the next 30 days ({} days) ",
+     ['ID', 'NAME', 'DAYS_TO_BIRTHDAY'], anchor='ID')(list_upcoming_birthday)
 
-    # US 39
-    for index, (hus_name, wife_name, DAYS_TO_ANNIVERSARY) in list_upcoming_anniversaries(families_df)[['HUSBAND NAME', 'WIFE NAME', 'DAYS_TO_ANNIVERSARY']].iterrows():
-        print("NOTICE: INDIVIDUAL: US39: Couple {} {}'s anniversary occur in the next 30 days ({} days) ".format(hus_name, wife_name, DAYS_TO_ANNIVERSARY))
+# US 39
+rule('US39', NOTICE, 'INDIVIDUAL', "Couple {} {}'s anniversary occur in the next 30 days ({} days) ",
+     ['HUSBAND NAME', 'WIFE NAME', 'DAYS_TO_ANNIVERSARY'])(list_upcoming_anniversaries)
 
-    # US 33
-    for id in list_orphans(indivs_df, families_df):
-        print("NOTICE: INDIVIDUAL: US33: Individual with id {} is an orphan ".format(id))
+# US 33
+rule('US33', NOTICE, 'INDIVIDUAL', "Individual with id {} is an orphan ", ['ID'],
+     tables=['join_both_spouses_to_family'], anchor='ID')(lambda ctx: [(orphan,) for orphan in list_orphans(ctx)])
 
-    # US 13
-    for (sib_id1, sib_id2, days) in siblings_spacing(indivs_df, families_df):
-        print("NOTICE: INDIVIDUAL: US13: Siblings with ids {} and {} were born {} days apart, violating sibling spacing".format(sib_id1, sib_id2, days))
+# US 13
+rule('US13', NOTICE, 'INDIVIDUAL',
+     "Siblings with ids {} and {} were born {} days apart, violating sibling spacing", ['ID1', 'ID2', 'DAYS'],
+     anchor='ID1')(siblings_spacing)
+
+# User stories that are not rules but can be selected as well
+table_story_ids = ['US28', 'US42']
 
 
+def unknown_story_ids(only: Set[str] = None, skip: Set[str] = None) -> Set[str]:
+    """:return: the ids in only and skip that are no user story"""
+    return ((only or set()) | (skip or set())) - set(story_ids()) - set(table_story_ids)
+
 if __name__ == "__main__":
     # input parsing
-    if len(sys.argv) != 2:
-        print("usage:", sys.argv[0], "<gedcom filepath>")
-    else:
-        run_all_checks(sys.argv[1])
+    arg_parser = argparse.ArgumentParser(description="Validate a GEDCOM file")
+    arg_parser.add_argument("gedcom", metavar="<gedcom filepath>")
+    arg_parser.add_argument("--jobs", type=int, default=1, metavar="N", help="run the user stories on N threads")
+    arg_parser.add_argument("--only", type=parse_story_ids, metavar="US01,US02,...",
+                            help="run only these user stories")
+    arg_parser.add_argument("--skip", type=parse_story_ids, metavar="US13,...", help="do not run these user stories")
+    arg_parser.add_argument("--format", choices=sorted(writers), default="text", dest="output_format",
+                            help="text prints tables and messages, jsonl and csv print one record per anomaly")
+    arg_parser.add_argument("--profile", action="store_true",
+                            help="print wall time, CPU time, rows and peak memory of every stage to stderr")
+    arg_parser.add_argument("--profile-json", metavar="FILE", help="write the --profile measurements to FILE as JSON")
+    arg_parser.add_argument("--no-memory", action="store_false", dest="memory",
+                            help="do not measure peak memory in --profile mode (tracing memory slows down stories)")
+    arg_parser.add_argument("--cache-dir", metavar="DIR",
+                            help="keep parsed files in DIR, a file validated before is not parsed again")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // 2 ** 20, metavar="MB",
+                            help="delete the least recently used files from the cache beyond this size (default: "
+                                 "%(default)s)")
+    arg_parser.add_argument("--incremental", metavar="STATE_FILE", dest="state_file",
+                            help="only re-run the user stories on the records that changed since the last run with the "
+                                 "same STATE_FILE")
+    arg_parser.add_argument("--compact", action="store_true",
+                            help="store ids and names as categoricals, which takes less memory")
+    args = arg_parser.parse_args()
+    unknown = unknown_story_ids(args.only, args.skip)
+    if unknown:
+        arg_parser.error("unknown user stories: " + ", ".join(sorted(unknown)))
+    profiler = Profiler(args.memory) if args.profile or args.profile_json else None
+    cache = ParseCache(args.cache_dir, args.cache_size * 2 ** 20) if args.cache_dir else None
+    run_all_checks(args.gedcom, args.jobs, args.only, args.skip, args.output_format, profiler, cache,
+                   args.state_file, args.compact)
+    if profiler is not None:
+        profiler.stop()
+        if args.profile:
+            print(profiler.table(), file=sys.stderr)
+        if args.profile_json:
+            with open(args.profile_json, 'w') as f:
+                f.write(profiler.to_json())
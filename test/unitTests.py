@@ -4,15 +4,31 @@ import sys
 
 sys.path.append('..')
 sys.path.append('../gedcomValidator')
-
-from gedcomValidator import validate, utils
-from gedcomValidator.gedcomParser.fileToDataframes import parseFileToDFs, indivs_columns, fams_columns
-from gedcomValidator.gedcomParser.fileToDicts import date_is_legitimate
+sys.path.append('../benchmarks')
+
+from gedcomValidator import validate, utils, batch, incremental
+from gedcomValidator.gedcomParser.fileToDataframes import parseFileToDFs, indivs_columns, fams_columns, day_number, \
+    to_day_numbers, add_age_columns
+from gedcomValidator.gedcomParser.fileToDicts import date_is_legitimate, parseRecords, parseFile, GedcomParser, \
+    tokenize
+from gedcomValidator.gedcomParser import fileToDicts
+from gedcomValidator.gedcomParser.parseCache import ParseCache
 import unittest
 from unittest import TestCase
 import numpy as np
 import pandas as pd
-from datetime import date
+from datetime import date, datetime
+from dateutil.relativedelta import relativedelta
+import generateGedcom
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
+import io
+import csv
+import json
+import glob
+import re
+from contextlib import redirect_stdout
 
 
 class TestParser(TestCase):
@@ -26,10 +42,28 @@ class TestParser(TestCase):
         for act, exp in zip(sorted(actual, key=lambda dict: dict['ID']), sorted(expected, key=lambda dict: dict['ID'])):
             self.assertEqual(act, exp)
 
+    def test_AGE_reference_date(self):
+        indivs_df, _ = parseFileToDFs("../gedcom_test_files/parser_test_ALIVE.ged", today=date(2018, 5, 19))
+        owen = indivs_df[indivs_df['ID'] == '@owen@'].iloc[0]
+        self.assertEqual(39, owen['AGE'])
+        self.assertEqual((date(2018, 5, 19) - date(1978, 5, 20)).days, owen['AGE_in_days'])
+        indivs_df, _ = parseFileToDFs("../gedcom_test_files/parser_test_ALIVE.ged", today=date(2018, 5, 20))
+        owen = indivs_df[indivs_df['ID'] == '@owen@'].iloc[0]
+        self.assertEqual(40, owen['AGE'])
+        mystery = indivs_df[indivs_df['ID'] == '@mystery@'].iloc[0]
+        self.assertEqual(420, mystery['AGE'])
+        self.assertTrue(mystery['ALIVE'])
+
     # no asserts, just crash-test
     def test_no_CHIL_backlink(self):
         indivs_df, fams_df = parseFileToDFs("../gedcom_test_files/parser_test_no_CHIL_backlink.ged")
 
+    def test_repaired_CHIL_backlinks(self):
+        parser = GedcomParser()
+        _, families = parser.parseFile("../gedcom_test_files/parser_test_no_CHIL_backlink.ged")
+        self.assertEqual(1, parser.repaired_backlinks)
+        self.assertEqual({'@owen@'}, families[0]['CHILDREN'])
+
     def test_minimal_gedcom(self):
         indivs_df, fams_df = parseFileToDFs("../gedcom_test_files/parser_test_minimal.ged")
         self.assertEqual(list(indivs_df.columns), indivs_columns)
@@ -44,6 +78,122 @@ class TestParser(TestCase):
         self.assertTrue(indivs_df.empty)
         self.assertTrue(fams_df.empty)
 
+    def test_typed_dates(self):
+        indivs_df, _ = parseFileToDFs("../gedcom_test_files/us41_accept_incomplete_dates.ged")
+        shmi = indivs_df[indivs_df['ID'] == '@shmi@'].iloc[0]
+        self.assertEqual(day_number(date(1957, 1, 1)), shmi['BIRTHDAY_DT'])
+        self.assertEqual('YEAR', shmi['BIRTHDAY_PRECISION'])
+        self.assertEqual(day_number(date(2002, 5, 1)), shmi['DEATH_DT'])
+        self.assertEqual('MONTH', shmi['DEATH_PRECISION'])
+        mystery = indivs_df[indivs_df['ID'] == '@mystery@'].iloc[0]
+        self.assertTrue(pd.isna(mystery['BIRTHDAY_DT']))
+
+    def test_early_dates(self):
+        # dates before 1677 (and after 2262) do not fit into datetime64[ns], but are common in family trees
+        indivs_df, fams_df = parseFileToDFs("../gedcom_test_files/parser_test_early_dates.ged", today=date(2018, 1, 1))
+        early = indivs_df[indivs_df['ID'] == '@early@'].iloc[0]
+        self.assertEqual(day_number(date(1600, 3, 1)), early['BIRTHDAY_DT'])
+        self.assertEqual(60, early['AGE'])
+        self.assertEqual((date(1660, 4, 5) - date(1600, 3, 1)).days, early['AGE_in_days'])
+        self.assertFalse(early['ALIVE'])
+        self.assertEqual(day_number(date(1625, 6, 10)), fams_df['MARRIED_DT'][0])
+        self.assertEqual([0, 1], list(to_day_numbers(pd.Series(['1 JAN 1970', '2 JAN 1970']))))
+        self.assertEqual(day_number(date(9999, 12, 31)), to_day_numbers(pd.Series(['31 DEC 9999']))[0])
+        self.assertTrue(to_day_numbers(pd.Series([np.nan, '30 FEB 2000'])).isna().all())
+
+    def test_unknown_death_date(self):
+        # a DEATH that is not a date still means the individual died, only the date (and so the age) is unknown
+        indivs_df = pd.DataFrame({'DEATH': ['30 FEB 2000', None, '1 JAN 2030', '1 JAN 2010'],
+                                  'BIRTHDAY_DT': to_day_numbers(pd.Series(['1 JAN 1990'] * 4))})
+        indivs_df['DEATH_DT'] = to_day_numbers(indivs_df['DEATH'])
+        add_age_columns(indivs_df, date(2018, 1, 1))
+        self.assertEqual([False, True, True, False], list(indivs_df['ALIVE']))
+        self.assertTrue(np.isnan(indivs_df['AGE'][0]))
+        self.assertEqual([28, 40, 20], list(indivs_df['AGE'][1:]))
+
+    def test_parse_records(self):
+        records = parseRecords("../gedcom_test_files/utils_test_get_descendents.ged")
+        tag, first = next(records)
+        self.assertEqual(("INDI", "@mystery@"), (tag, first["ID"]))
+        tags = [tag] + [tag for tag, _ in records]
+        self.assertEqual(10, tags.count("INDI"))
+        self.assertEqual(4, tags.count("FAM"))
+
+    def test_FAM_before_INDI(self):
+        _, fams_df = parseFileToDFs("../gedcom_test_files/parser_test_FAM_before_INDI.ged")
+        expected = [{'ID': '@sky1@', 'HUSBAND NAME': 'The /Force/', 'WIFE NAME': 'Shmi /Skywalker/'}]
+        actual = [row.to_dict() for _, row in fams_df[['ID', 'HUSBAND NAME', 'WIFE NAME']].iterrows()]
+        self.assertEqual(expected, actual)
+
+    def test_concurrent_parse(self):
+        files = ["../gedcom_test_files/utils_test_get_descendents.ged",
+                 "../gedcom_test_files/us33_list_orphans.ged",
+                 "../gedcom_test_files/sprint2_acceptance_file.ged"] * 4
+        expected = [parseFile(f) for f in files]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            actual = list(pool.map(parseFile, files))
+        self.assertEqual(expected, actual)
+
+    def test_tokenize(self):
+        # same tokens as the regular expression the parser used to split lines with
+        for filename in glob.glob("../gedcom_test_files/*.ged"):
+            with open(filename) as f:
+                expected = [re.sub(r"[^\w.*/@]", " ", line).split() for line in f]
+            self.assertEqual([tokens for tokens in expected if tokens], list(tokenize(filename)), filename)
+
+    def test_tokenize_chunks(self):
+        content = "\ufeff0 HEAD\r\n\n1 NAME Zoë /Ästrøm/\r\n2 DATE 1 JAN-2000\n0 TRLR"
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "test.ged")
+            with open(filename, "w", encoding="utf-8", newline="") as f:
+                f.write(content)
+            expected = [["0", "HEAD"], ["1", "NAME", "Zoë", "/Ästrøm/"], ["2", "DATE", "1", "JAN", "2000"],
+                        ["0", "TRLR"]]
+            self.assertEqual(expected, list(tokenize(filename)))
+            chunk_size = fileToDicts.CHUNK_SIZE
+            fileToDicts.CHUNK_SIZE = 4
+            try:
+                self.assertEqual(expected, list(tokenize(filename)))
+            finally:
+                fileToDicts.CHUNK_SIZE = chunk_size
+            open(filename, "w").close()
+            self.assertEqual([], list(tokenize(filename)))
+
+    def test_CR_line_endings(self):
+        # old Mac files end their lines with a lone \r
+        filename = "../gedcom_test_files/parser_test_CR_line_endings.ged"
+        indivs_df, fams_df = parseFileToDFs(filename)
+        self.assertEqual(['Ann /Cr/', 'Bob /Cr/'], list(indivs_df['NAME']))
+        self.assertEqual(('@b@', 'Bob /Cr/', '3 MAR 2015'),
+                         tuple(fams_df.loc[0, ['HUSBAND ID', 'HUSBAND NAME', 'MARRIED']]))
+        chunk_size = fileToDicts.CHUNK_SIZE
+        fileToDicts.CHUNK_SIZE = 4
+        try:
+            self.assertEqual(19, len(list(tokenize(filename))))
+        finally:
+            fileToDicts.CHUNK_SIZE = chunk_size
+
+    def test_compact(self):
+        filename = "../gedcom_test_files/full_acceptance_test.ged"
+        indivs_df, fams_df = parseFileToDFs(filename)
+        compact_indivs_df, compact_fams_df = parseFileToDFs(filename, compact=True)
+        self.assertEqual(list(indivs_df.columns), list(compact_indivs_df.columns))
+        self.assertEqual(indivs_df['AGE'].dtype, compact_indivs_df['AGE'].dtype)
+        # all ids share the categories, so merges and comparisons of ids run on the codes
+        ids = compact_indivs_df['ID'].dtype
+        self.assertEqual(ids, compact_indivs_df['CHILD'].dtype)
+        self.assertEqual(ids, compact_fams_df['HUSBAND ID'].dtype)
+        self.assertIn('@F1@', ids.categories)
+        self.assertEqual(list(indivs_df['ID']), list(compact_indivs_df['ID']))
+        pd.testing.assert_series_equal(indivs_df['AGE'], compact_indivs_df['AGE'])
+        normal, compact = io.StringIO(), io.StringIO()
+        with redirect_stdout(normal):
+            validate.run_all_checks(filename, only={'US05', 'US09', 'US14', 'US28', 'US31'}, output_format='jsonl')
+        with redirect_stdout(compact):
+            validate.run_all_checks(filename, only={'US05', 'US09', 'US14', 'US28', 'US31'}, output_format='jsonl',
+                                    compact=True)
+        self.assertEqual(normal.getvalue(), compact.getvalue())
+
 
 class TestUtils(TestCase):
     def test_get_children(self):
@@ -57,6 +207,26 @@ class TestUtils(TestCase):
         descendents = utils.get_descendants("@mystery@", fams_df)
         expected = {'@ani@', '@luke@', '@lea@', '@kylo@'}
         self.assertEqual(expected, descendents)
+        # many queries share the index of a context (or of a FamilyGraph) instead of building one per call
+        ctx = validate.ValidationContext(indivs_df, fams_df)
+        self.assertEqual(expected, utils.get_descendants("@mystery@", ctx))
+        self.assertEqual({'@luke@', '@lea@', '@kylo@'}, utils.get_descendants("@ani@", ctx))
+        self.assertEqual(expected, utils.get_descendants("@mystery@", ctx.family_graph()))
+        # the answers of the earlier queries were remembered by the context's graph
+        self.assertEqual(2, len(ctx.family_graph()._descendants))
+
+    def test_calc_delta_date(self):
+        pairs = [('29 FEB 2016', '28 FEB 2017'), ('29 FEB 2016', '1 MAR 2017'), ('1 JUN 2000', '1 JAN 1990'),
+                 ('1 JAN 1990', '1 JUN 2000'), ('28 FEB 2017', '29 FEB 2016'), ('31 MAR 2001', '28 FEB 2000'),
+                 ('29 FEB 2000', '28 FEB 2001'), ('29 FEB 2000', '29 FEB 2004'), ('1 MAR 1600', '5 APR 1660')]
+        df = pd.DataFrame({'FROM_DT': to_day_numbers(pd.Series([start for start, _ in pairs] + [None])),
+                           'TO_DT': to_day_numbers(pd.Series([end for _, end in pairs] + ['1 JAN 2000']))})
+        delta = utils.calc_delta_date(df, 'FROM_DT', 'TO_DT')
+        expected = [relativedelta(datetime.strptime(end, '%d %b %Y'), datetime.strptime(start, '%d %b %Y')).years
+                    for start, end in pairs]
+        self.assertEqual([1, 1, -10, 10, 0, -1, 1, 4, 60], expected)
+        self.assertEqual(expected, list(delta[:len(pairs)]))
+        self.assertTrue(pd.isna(delta[len(pairs)]))
 
     def test_get_spouses(self):
         indivs_df, fams_df = parseFileToDFs("../gedcom_test_files/utils_test_get_descendents.ged")
@@ -64,6 +234,298 @@ class TestUtils(TestCase):
         self.assertEqual({'@lea@'}, utils.get_spouses("@han@", fams_df))
         self.assertEqual(set(), utils.get_spouses("@luke@", fams_df))
 
+    def test_family_graph(self):
+        indivs_df, fams_df = parseFileToDFs("../gedcom_test_files/utils_test_get_descendents.ged")
+        graph = utils.FamilyGraph(fams_df)
+        self.assertEqual({'@ani@', '@luke@', '@lea@', '@kylo@'}, graph.descendants('@mystery@'))
+        self.assertEqual({'@ani@', '@padme@', '@shmi@', '@mystery@'}, graph.ancestors('@luke@'))
+        self.assertEqual(set(), graph.ancestors('@mystery@'))
+        self.assertEqual({'@ani@': graph.descendants('@ani@'), '@nobody@': set()},
+                         graph.descendants_of(['@ani@', '@nobody@']))
+
+    def test_family_graph_cycle(self):
+        fams_df = pd.DataFrame({'HUSBAND ID': ['@a@', '@b@'], 'WIFE ID': [np.nan, '@c@'],
+                                'CHILDREN': [{'@b@'}, {'@a@'}]})
+        graph = utils.FamilyGraph(fams_df)
+        self.assertEqual({'@a@', '@b@'}, graph.descendants('@a@'))
+        self.assertEqual({'@a@', '@b@', '@c@'}, graph.ancestors('@b@'))
+        self.assertEqual({'@a@', '@b@'}, utils.get_descendants('@c@', fams_df))
+
+    def test_family_links(self):
+        indivs_df, fams_df = parseFileToDFs("../gedcom_test_files/utils_test_get_descendents.ged")
+        links = utils.FamilyLinks(fams_df)
+        for individual_id in list(indivs_df['ID']) + ['@nobody@']:
+            self.assertEqual(utils.get_children(individual_id, fams_df), utils.get_children(individual_id, links))
+            self.assertEqual(utils.get_spouses(individual_id, fams_df), utils.get_spouses(individual_id, links))
+        for husband_id, wife_id, children in zip(fams_df['HUSBAND ID'], fams_df['WIFE ID'], fams_df['CHILDREN']):
+            self.assertEqual(children, utils.get_children_of_couple(husband_id, wife_id, links))
+        self.assertEqual(set(), utils.get_children_of_couple('@shmi@', np.nan, links))
+        # the children of a family are a slice of the index
+        for family, children in enumerate(fams_df['CHILDREN']):
+            self.assertEqual(children, {links.ids[c] for c in links.children(family)})
+        self.assertEqual(len(links.ids), len(set(links.ids)))
+
+    def test_family_links_individual_without_family(self):
+        # only ids that occur in some family are interned, everyone else has the code -1 and no relatives
+        fams_df = pd.DataFrame({'HUSBAND ID': ['@a@'], 'WIFE ID': ['@b@'], 'CHILDREN': [{'@c@'}]})
+        links = utils.FamilyLinks(fams_df)
+        graph = utils.FamilyGraph(fams_df, links)
+        self.assertEqual({'@a@', '@b@', '@c@'}, set(links.ids))
+        self.assertEqual(-1, links.code('@loner@'))
+        self.assertEqual(0, len(links.spouse_families(links.code('@loner@'))))
+        self.assertEqual(set(), links.children_of('@loner@'))
+        self.assertEqual(set(), links.spouses_of('@loner@'))
+        self.assertEqual(set(), links.children_of_couple('@loner@', '@b@'))
+        self.assertEqual(set(), links.children_of_couple('@a@', '@loner@'))
+        self.assertEqual(set(), graph.descendants('@loner@'))
+        self.assertEqual(set(), graph.ancestors('@loner@'))
+        self.assertEqual({'@c@'}, graph.descendants('@a@'))
+
+    def test_join_by_child(self):
+        indivs_df, fams_df = parseFileToDFs("../gedcom_test_files/utils_test_get_descendents.ged")
+        joined = utils.join_by_child(indivs_df, fams_df)
+        expected = {(c, f) for f, children in zip(fams_df['ID'], fams_df['CHILDREN']) for c in children}
+        self.assertEqual(expected, set(zip(joined['ID'], joined['ID_fam'])))
+        self.assertEqual(len(expected), len(joined))
+        self.assertEqual(list(indivs_df.columns) + [c + '_fam' if c == 'ID' else c for c in fams_df.columns],
+                         list(joined.columns))
+        empty = utils.join_by_child(indivs_df, fams_df.iloc[:0])
+        self.assertTrue(empty.empty)
+        self.assertIn('ID_fam', empty.columns)
+
+
+class TestValidationContext(TestCase):
+    def test_joins_computed_once(self):
+        indivs_df, fams_df = parseFileToDFs("../gedcom_test_files/utils_test_get_descendents.ged")
+        ctx = validate.ValidationContext(indivs_df, fams_df)
+        self.assertIs(ctx.join_by_spouse(), ctx.join_by_spouse())
+        self.assertIs(ctx.join_by_child(), ctx.join_by_child())
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            joins = list(pool.map(lambda _: ctx.join_both_spouses_to_family(), range(8)))
+        self.assertTrue(all(join is joins[0] for join in joins))
+        self.assertIs(ctx, validate.ValidationContext.of(ctx))
+
+    def test_stories_accept_context(self):
+        indivs_df, fams_df = parseFileToDFs("../gedcom_test_files/us21_correct_gender_for_role.ged")
+        ctx = validate.ValidationContext(indivs_df, fams_df)
+        pd.testing.assert_frame_equal(validate.correct_gender_for_role(indivs_df, fams_df),
+                                      validate.correct_gender_for_role(ctx))
+        pd.testing.assert_frame_equal(validate.list_deceased(indivs_df), validate.list_deceased(ctx))
+
+
+class TestRunChecks(TestCase):
+    def run_all_checks(self, filename, jobs):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            validate.run_all_checks(filename, jobs)
+        return output.getvalue()
+
+    def test_jobs_same_output(self):
+        for filename in ["../gedcom_test_files/sprint3_acceptance_file.ged",
+                         "../gedcom_test_files/full_acceptance_test.ged"]:
+            sequential = self.run_all_checks(filename, 1)
+            self.assertIn("NOTICE", sequential)
+            self.assertEqual(sequential, self.run_all_checks(filename, 4))
+
+    def test_select_rules(self):
+        indivs_df, fams_df = parseFileToDFs("../gedcom_test_files/sprint1_acceptance_file.ged")
+        ctx = validate.ValidationContext(indivs_df, fams_df)
+        selected = validate.select_rules(only={'US01', 'US03', 'US05'}, skip={'US05'})
+        self.assertEqual(['US01', 'US03'], list(dict.fromkeys(r.story_id for r in selected)))
+        messages = [a.text for anomalies in validate.run_checks(ctx, selected) for a in anomalies]
+        self.assertIn("ERROR: INDIVIDUAL: US01: @mystery@: Dates before current date - Death 20 MAY 2200", messages)
+        self.assertTrue(all(": US01: " in m or ": US03: " in m for m in messages))
+        # US01 and US03 need no joins
+        self.assertNotIn('join_by_spouse', ctx._tables)
+
+    def test_jsonl_format(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            validate.run_all_checks("../gedcom_test_files/us42_reject_illegitimate_dates.ged", output_format='jsonl',
+                                    only={'US01', 'US42'})
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual({'story': 'US42', 'severity': 'ERROR', 'entity': 'PARSER',
+                          'message': "DATE '44 MAY 1950' is illegitimate", 'fields': {'DATE': '44 MAY 1950'}},
+                         records[0])
+        self.assertTrue(all(r['story'] in ('US01', 'US42') for r in records))
+
+    def test_csv_format(self):
+        text, csv_output = io.StringIO(), io.StringIO()
+        with redirect_stdout(text):
+            validate.run_all_checks("../gedcom_test_files/sprint1_acceptance_file.ged", only={'US01', 'US02'})
+        with redirect_stdout(csv_output):
+            validate.run_all_checks("../gedcom_test_files/sprint1_acceptance_file.ged", only={'US01', 'US02'},
+                                    output_format='csv')
+        rows = list(csv.DictReader(io.StringIO(csv_output.getvalue())))
+        messages = ["{}: {}: {}: {}".format(r['severity'], r['entity'], r['story'], r['message']) for r in rows]
+        self.assertEqual([line for line in text.getvalue().splitlines() if ": US0" in line], messages)
+        self.assertEqual('@mystery@', json.loads(rows[0]['fields'])['ID'])
+
+    def test_parse_story_ids(self):
+        self.assertEqual({'US01', 'US02', 'US13'}, validate.parse_story_ids("US01,us2, 13,"))
+
+    def test_profile(self):
+        profiler = validate.Profiler()
+        output = io.StringIO()
+        with redirect_stdout(output):
+            validate.run_all_checks("../gedcom_test_files/sprint1_acceptance_file.ged", only={'US01', 'US02', 'US28'},
+                                    output_format='jsonl', profiler=profiler)
+        profiler.stop()
+        summary = profiler.summary()
+        self.assertEqual({'records', 'data-frames', 'dates', 'ages', 'join_by_spouse', 'US01', 'US02'},
+                         set(summary.index))
+        self.assertEqual(len(output.getvalue().splitlines()), summary.loc[['US01', 'US02'], 'rows_out'].sum())
+        self.assertTrue((summary['wall_s'].diff().dropna() <= 0).all())
+        self.assertTrue((summary['peak_mb'] > 0).all())
+        self.assertEqual(list(summary.index), [r['stage'] for r in json.loads(profiler.to_json())])
+
+    def test_profile_unknown_rows(self):
+        profiler = validate.Profiler(memory=False)
+        with profiler.stage('counted', rows_in=3) as profile:
+            profile.rows_out = 2
+        with profiler.stage('uncounted'):
+            pass
+        summary = profiler.summary()
+        self.assertEqual(['float64'] * 3, [str(summary[c].dtype) for c in ['rows_in', 'rows_out', 'peak_mb']])
+        records = {r['stage']: r for r in json.loads(profiler.to_json())}
+        self.assertEqual((3, 2), (records['counted']['rows_in'], records['counted']['rows_out']))
+        self.assertEqual((None, None, None), (records['uncounted']['rows_in'], records['uncounted']['rows_out'],
+                                              records['uncounted']['peak_mb']))
+
+
+class TestParseCache(TestCase):
+    def parse(self, filename, cache):
+        profiler, dates = validate.Profiler(memory=False), []
+        dfs = parseFileToDFs(filename, date(2020, 1, 1), dates.append, profiler, cache)
+        return dfs, dates, {p.name for p in profiler.stages}
+
+    def test_warm_run_skips_parsing(self):
+        filename = "../gedcom_test_files/us42_reject_illegitimate_dates.ged"
+        with tempfile.TemporaryDirectory() as directory:
+            cold, cold_dates, cold_stages = self.parse(filename, ParseCache(directory))
+            warm, warm_dates, warm_stages = self.parse(filename, ParseCache(directory))
+        self.assertIn('records', cold_stages)
+        self.assertNotIn('records', warm_stages)
+        self.assertEqual(['44 MAY 1950', '29 FEB 1923'], cold_dates[:2])
+        self.assertEqual(cold_dates, warm_dates)
+        for cold_df, warm_df in zip(cold, warm):
+            pd.testing.assert_frame_equal(cold_df, warm_df)
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ParseCache(directory, max_bytes=1)
+            for filename in ["../gedcom_test_files/sprint1_acceptance_file.ged",
+                             "../gedcom_test_files/sprint2_acceptance_file.ged"]:
+                self.parse(filename, cache)
+            self.assertEqual([os.path.basename(cache.path(cache.key(filename)))], os.listdir(directory))
+
+
+class TestIncremental(TestCase):
+    def run_all_checks(self, filename, state_file):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            validate.run_all_checks(filename, output_format='jsonl', state_file=state_file, skip={'US13'})
+        return output.getvalue()
+
+    def test_same_findings_as_full_run(self):
+        with open("../gedcom_test_files/full_acceptance_test.ged") as f:
+            content = f.read()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "tree.ged")
+            with open(filename, "w") as f:
+                f.write(content)
+            first = self.run_all_checks(filename, os.path.join(directory, "state"))
+            # Matt is now born after his children
+            with open(filename, "w") as f:
+                f.write(content.replace("2 DATE 5 FEB 1850", "2 DATE 5 FEB 2001"))
+            edited = self.run_all_checks(filename, os.path.join(directory, "state"))
+            self.assertNotEqual(first, edited)
+            self.assertEqual(self.run_all_checks(filename, os.path.join(directory, "new_state")), edited)
+
+    def test_affected_records(self):
+        members = {'@F1@': {'@dad@', '@mom@', '@kid@'}, '@F2@': {'@kid@', '@wife@'}, '@F3@': {'@other@'}}
+        anchors, scope = incremental.affected_records({'@mom@'}, members, members)
+        self.assertEqual({'@mom@', '@dad@', '@kid@', '@F1@'}, anchors)
+        self.assertEqual(anchors | {'@F2@', '@wife@'}, scope)
+
+
+class TestBatch(TestCase):
+    def test_run_batch(self):
+        files = batch.find_gedcom_files(["../gedcom_test_files/sprint1_acceptance_file.ged",
+                                         "../gedcom_test_files/us2[1-3]_*.ged",
+                                         "../gedcom_test_files/parser_test_minimal.ged"])
+        self.assertEqual(5, len(files))
+        with tempfile.TemporaryDirectory() as directory:
+            results = batch.run_batch(files, directory, jobs=2, output_format='jsonl', skip={'US13'})
+            self.assertEqual(files, [r['file'] for r in results])
+            # a file the validator fails on does not stop the others
+            self.assertEqual(['ok'] * 4 + ['failed'], [r['status'] for r in results])
+            expected = io.StringIO()
+            with redirect_stdout(expected):
+                validate.run_all_checks(files[0], output_format='jsonl', skip={'US13'})
+            with open(results[0]['output']) as f:
+                self.assertEqual(expected.getvalue(), f.read())
+            self.assertEqual(len(expected.getvalue().splitlines()), results[0]['anomalies'])
+            with open(os.path.join(directory, 'summary.json')) as f:
+                summary = json.load(f)
+            self.assertEqual((5, 1), (summary['files'], summary['failed']))
+
+    def test_run_batch_jobs(self):
+        # several workers, each validating several files, write the same results as a single one
+        files = batch.find_gedcom_files(["../gedcom_test_files/us1*.ged"])
+        self.assertLess(3, len(files))
+        outputs = []
+        for jobs in [1, 3]:
+            with tempfile.TemporaryDirectory() as directory:
+                results = batch.run_batch(files, directory, jobs=jobs, output_format='jsonl')
+                self.assertEqual(['ok'] * len(files), [r['status'] for r in results])
+                output = []
+                for r in results:
+                    with open(r['output']) as f:
+                        output.append(f.read())
+                outputs.append(output)
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_result_paths(self):
+        self.assertEqual([os.path.join('out', 'a.txt'), os.path.join('out', 'a_2.txt')],
+                         batch.result_paths(['x/a.ged', 'y/a.ged'], 'out', 'text'))
+
+
+class TestGenerateGedcom(TestCase):
+    def test_valid_tree(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "generated.ged")
+            generateGedcom.write_gedcom(generateGedcom.generate_tree(500, seed=1), filename)
+            indivs_df, fams_df = parseFileToDFs(filename)
+        self.assertEqual(500, len(indivs_df))
+        self.assertEqual(500, indivs_df['ID'].nunique())
+        self.assertFalse(fams_df.empty)
+        ctx = validate.ValidationContext(indivs_df, fams_df)
+        errors = [r.story_id for r in validate.select_rules() if r.severity == validate.ERROR
+                  and r.anomalies(ctx)]
+        self.assertEqual([], errors)
+
+    def test_injected_anomalies(self):
+        tree = generateGedcom.generate_tree(200, seed=2)
+        manifest = generateGedcom.inject_anomalies(tree, {story_id: 2 for story_id in generateGedcom.injections}, 2)
+        output = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "generated.ged")
+            generateGedcom.write_gedcom(tree, filename)
+            with redirect_stdout(output):
+                validate.run_all_checks(filename, output_format='jsonl')
+        errors = [json.loads(line) for line in output.getvalue().splitlines()]
+        errors = [e for e in errors if e['severity'] == 'ERROR']
+        self.assertEqual(sorted(f['story'] for f in manifest), sorted(e['story'] for e in errors))
+        reported = {(e['story'], value) for e in errors for value in e['fields'].values()}
+        self.assertEqual([], [f for f in manifest if (f['story'], f['id']) not in reported])
+
+    def test_seeded(self):
+        first = generateGedcom.generate_tree(200, seed=3)
+        second = generateGedcom.generate_tree(200, seed=3)
+        self.assertEqual([(i.id, i.birth, i.famc) for i in first.individuals],
+                         [(i.id, i.birth, i.famc) for i in second.individuals])
+
 
 # US 01
 class TestDatesBeforeCurrentDate(TestCase):
@@ -323,6 +785,18 @@ class TestOrderSiblingsByAge(TestCase):
         self.assertEqual(list(ordered_fams_df['CHILDREN'])[0][2], ('@ani2@', '7672.0 days old'))
         self.assertEqual(list(ordered_fams_df['CHILDREN'])[0][3], ('@ani3@', '7671.0 days old'))
 
+    def test_families(self):
+        indivs_df = pd.DataFrame({'ID': ['@a@', '@b@', '@c@', '@d@', '@a@'], 'AGE_in_days': [10, 30, np.nan, 30, 99]})
+        fams_df = pd.DataFrame({'ID': ['@f1@', '@f2@', '@f3@', '@f4@'],
+                                'CHILDREN': [{'@a@', '@b@', '@c@', '@x@'}, set(), None, {'@d@', '@b@'}]})
+        ordered = list(validate.order_siblings_by_age(indivs_df, fams_df)['CHILDREN'])
+        # unknown birthdays (and unknown children) first, in the order of the set
+        unknown = [(c, 'no birthday') for c in fams_df['CHILDREN'][0] if c in ('@c@', '@x@')]
+        self.assertEqual(unknown + [('@b@', '30.0 days old'), ('@a@', '10.0 days old')], ordered[0])
+        self.assertEqual([[], []], ordered[1:3])
+        # ties stay in the order of the set
+        self.assertEqual([(c, '30.0 days old') for c in fams_df['CHILDREN'][3]], ordered[3])
+
 
 # US 29
 class TestShowDead(TestCase):
@@ -457,6 +931,18 @@ class TestListRecentSurvivors(TestCase):
         actual = [row.to_dict() for _, row in recent_survivors[['ID', 'living spouses', 'living descendants']].iterrows()]
         self.assertEqual(sorted(actual, key=lambda d: d['ID']), sorted(expected, key=lambda d: d['ID']))
 
+    def test_many_deaths(self):
+        recently = day_number(date.today()) - 5
+        indivs_df = pd.DataFrame({'ID': ['@a@', '@b@', '@c@', '@d@', '@e@'],
+                                  'ALIVE': [False, False, True, False, True],
+                                  'DEATH_DT': [recently, recently, np.nan, day_number(date(1990, 1, 1)), np.nan]})
+        fams_df = pd.DataFrame({'ID': ['@f1@', '@f2@', '@f3@'], 'HUSBAND ID': ['@a@', '@c@', '@b@'],
+                                'WIFE ID': ['@b@', '@d@', np.nan], 'CHILDREN': [{'@c@'}, {'@e@'}, set()]})
+        survivors = validate.list_recent_survivors(indivs_df, fams_df)
+        self.assertEqual(['@a@', '@b@'], list(survivors['ID']))
+        self.assertEqual([set(), set()], list(survivors['living spouses']))
+        self.assertEqual([{'@c@', '@e@'}, {'@c@', '@e@'}], list(survivors['living descendants']))
+
 
 # US38
 class TestListUpcomingBirthday(TestCase):
@@ -485,6 +971,16 @@ class TestListOrphans(TestCase):
         expected2 =['@luke@', '@lea@']
         self.assertTrue((orphans == expected) or (orphans == expected2))
 
+    def test_both_parents_dead(self):
+        indivs_df = pd.DataFrame({'ID': ['@h1@', '@w1@', '@h2@', '@w2@', '@a@', '@b@', '@c@', '@d@'],
+                                  'ALIVE': [False, False, False, True, True, True, True, True],
+                                  'AGE': [50, 50, 50, 50, 10, 20, np.nan, 5]})
+        fams_df = pd.DataFrame({'ID': ['@f1@', '@f2@', '@f3@'], 'HUSBAND ID': ['@h1@', '@h2@', '@h1@'],
+                                'WIFE ID': ['@w1@', '@w2@', '@w1@'],
+                                'CHILDREN': [{'@a@', '@b@', '@c@', '@x@'}, {'@d@'}, {'@a@'}]})
+        # only the children of couples where both are dead, under 18 (age known), each once
+        self.assertEqual(['@a@'], validate.list_orphans(indivs_df, fams_df))
+
    
 # US13
 class TestSiblingSpacing(TestCase):
@@ -495,5 +991,17 @@ class TestSiblingSpacing(TestCase):
         expected2 = {('@I4@', '@I1@', 6)}
         self.assertTrue(strange_siblings == expected or strange_siblings == expected2)
 
+    def test_window(self):
+        birthdays = ['1 JAN 2000', '3 JAN 2000', '4 JAN 2000', '1 SEP 2000', '11 JAN 2005', None, '20 JAN 2005']
+        indivs_df = pd.DataFrame({'ID': ['@a@', '@b@', '@c@', '@d@', '@e@', '@f@', '@g@'],
+                                  'BIRTHDAY_DT': to_day_numbers(pd.Series(birthdays))})
+        fams_df = pd.DataFrame({'ID': ['@f1@', '@f2@', '@f3@'],
+                                'CHILDREN': [{'@a@', '@b@', '@c@', '@d@', '@e@', '@f@'}, {'@e@', '@g@', '@x@'}, set()]})
+        # 2 days apart are twins, 8 months apart (@a@, @d@) or years apart (@a@, @e@) are fine, a missing birthday or
+        # a missing individual is skipped
+        self.assertEqual({('@a@', '@c@', 3), ('@b@', '@d@', 242), ('@c@', '@d@', 241), ('@e@', '@g@', 9)},
+                         validate.siblings_spacing(indivs_df, fams_df))
+        self.assertEqual(set(), validate.siblings_spacing(indivs_df, fams_df.iloc[2:]))
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file